@@ -1,53 +1,687 @@
 import os
 import json
+import queue
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
 from http.server import BaseHTTPRequestHandler
 from urllib.parse import urlparse, parse_qs
 
-# 這裡需要複製 app.py 中的 Firebase 初始化和訊息產生邏輯
-# 為了簡化，我們直接從 app.py 導入它們
-# 注意：這需要在部署時確保 app.py 也在環境中
+# Firebase 初始化與訊息產生邏輯從 core.py 導入，不需要載入 app.py 的 Flask app 與 webhook 處理器
+# 注意：這需要在部署時確保 core.py 也在環境中
 # (在 Vercel 中，這通常是自動處理的)
-from app import db, configuration, get_countdown_message, logger
+from core import ACTIVE_COUNTDOWNS, ARCHIVE_GRACE_DAYS, countdown_cutoff, get_db, get_messaging_api, LINE_POOL_SIZE, WriteBatcher, logger, taipei_now, CountdownRenderer, timed_import, log_cold_start
 
-from linebot.v3.messaging import (
-    ApiClient,
-    MessagingApi,
-    PushMessageRequest,
-    TextMessage
-)
+with timed_import('firebase_admin'):
+    from firebase_admin import firestore
+    from google.cloud.firestore_v1.base_query import FieldFilter
+    from google.cloud.firestore_v1.field_path import FieldPath
 
-# 主要的排程任務邏輯
-def execute_job():
-    logger.info("Executing daily countdown message task via Vercel Cron...")
-    if db is None:
-        logger.error("Firestore client not available. Skipping scheduled job.")
-        return False
+with timed_import('linebot'):
+    from linebot.v3.messaging import (
+        MulticastRequest,
+        PushMessageRequest,
+        TextMessage
+    )
 
-    with ApiClient(configuration) as api_client:
-        line_bot_api = MessagingApi(api_client)
-        
-        chats_ref = db.collection('chats')
-        docs = chats_ref.stream()
+# LINE multicast 單次最多 500 位收件者，且只接受使用者 ID (群組必須逐一 push)
+MULTICAST_MAX_RECIPIENTS = 500
+
+def is_user_chat(chat_id):
+    # active_countdowns 索引不存 type，以 LINE ID 前綴判斷 (U: 使用者, C: 群組, R: 聊天室)
+    return chat_id.startswith('U')
+
+# 同時進行的 LINE API 呼叫數上限 (可透過環境變數調整)，應不大於 LINE_POOL_SIZE 才能全部重複使用連線
+PUSH_CONCURRENCY = int(os.getenv('PUSH_CONCURRENCY', '8'))
+if PUSH_CONCURRENCY > LINE_POOL_SIZE:
+    logger.warning(f"PUSH_CONCURRENCY ({PUSH_CONCURRENCY}) exceeds LINE_POOL_SIZE ({LINE_POOL_SIZE}); extra connections will not be reused.")
+# 單次執行的時間預算 (秒)，需小於 Vercel Function 的逾時時間，保留時間寫入進度
+JOB_TIME_BUDGET_SECONDS = float(os.getenv('JOB_TIME_BUDGET_SECONDS', '50'))
+# 每頁讀取的聊天室數量；每處理完一頁就儲存一次進度
+JOB_PAGE_SIZE = int(os.getenv('JOB_PAGE_SIZE', '500'))
+# 預先讀取、等待發送的頁數上限；佇列滿時讀取端會暫停 (backpressure)，記憶體用量維持固定
+JOB_PREFETCH_PAGES = int(os.getenv('JOB_PREFETCH_PAGES', '2'))
+# 同時讀取的文件 ID 區段數；聊天室數量很大時，單一游標循序讀取會成為瓶頸
+JOB_PARTITIONS = max(1, int(os.getenv('JOB_PARTITIONS', '1')))
+# 執行鎖的租期 (秒)；持有者每隔租期的三分之一續約一次，當機的執行最多佔用鎖這麼久
+JOB_LEASE_SECONDS = float(os.getenv('JOB_LEASE_SECONDS', '90'))
+
+def build_send_plan(docs, renderer):
+    """將聊天室依照要發送的訊息內容分組，產生發送任務清單。
+
+    每個任務為 (kind, 訊息, [收件者 ID, ...])：
+    kind 為 'multicast' 時收件者為使用者，每組最多 MULTICAST_MAX_RECIPIENTS 人；
+    kind 為 'push' 時收件者為單一群組，需逐一發送。
+    """
+    recipients_by_message = {}
+    tasks = []
+    for doc in docs:
+        chat_id = doc.id
+        exam_day = doc.get('exam_day')
+        if exam_day is None:
+            continue
+        message_text = renderer.render_day(exam_day)
+        if is_user_chat(chat_id):
+            recipients_by_message.setdefault(message_text, []).append(chat_id)
+        else:
+            tasks.append(('push', message_text, [chat_id]))
+
+    for message_text, user_ids in recipients_by_message.items():
+        for start in range(0, len(user_ids), MULTICAST_MAX_RECIPIENTS):
+            tasks.append(('multicast', message_text, user_ids[start:start + MULTICAST_MAX_RECIPIENTS]))
+    return tasks
 
-        for doc in docs:
-            chat_id = doc.id
-            chat_data = doc.to_dict()
-            exam_date_str = chat_data.get('exam_date')
+def active_chats_query(db, today, hour):
+    """從 active_countdowns 索引讀取提醒時間不晚於 hour、還在倒數、且今天還沒發送過的聊天室。
 
-            if exam_date_str:
+    send_hour 為聊天室選擇的台北時間整點，排程每小時執行一次。今天較早的時段已發送的聊天室
+    會被 last_sent_day 排除，因此每次實際讀到的是當下這個小時的分桶，加上較早時段因時間預算用完
+    或發送失敗而留下的聊天室 (由這次補發或重試)。
+    exam_day 為考試日的日序數，可直接做索引範圍查詢；考試結束後的 ARCHIVE_GRACE_DAYS 天內仍會發送。
+    last_sent_day 為最後一次成功發送的日序數，今天已發送的聊天室在查詢階段就被排除，
+    重複觸發排程幾乎不需要任何讀取。
+    索引由 webhook 設定日期時維護；既有資料需先執行 scripts/migrate_exam_day.py 建立索引。
+    """
+    return (
+        db.collection(ACTIVE_COUNTDOWNS)
+        .where(filter=FieldFilter('send_hour', '<=', hour))
+        .where(filter=FieldFilter('exam_day', '>=', countdown_cutoff(today)))
+        .where(filter=FieldFilter('last_sent_day', '<', today.toordinal()))
+        .select(['send_hour', 'exam_day', 'last_sent_day'])
+    )
+
+# 每個 WriteBatch 封存的聊天室數量；每個聊天室需要三筆寫入 (寫入封存、刪除聊天室、刪除索引)
+ARCHIVE_CHUNK_SIZE = 150
+
+def _archive_batch(db, entries):
+    """以一個 WriteBatch 封存 entries [(索引文件, 聊天室文件), ...]，回傳實際搬到封存的聊天室數量。
+
+    刪除都帶有 last_update_time 前置條件：讀取之後聊天室或索引被修改 (例如剛設定新的考試日期) 時，
+    整批提交會失敗，不會把新的設定刪掉。
+    """
+    archive_ref = db.collection('archived_chats')
+    batch = db.batch()
+    copied = 0
+    for index_doc, chat in entries:
+        if chat is not None and chat.exists:
+            archived_data = chat.to_dict()
+            archived_data['archived_at'] = firestore.SERVER_TIMESTAMP
+            batch.set(archive_ref.document(chat.id), archived_data)
+            batch.delete(chat.reference, option=db.write_option(last_update_time=chat.update_time))
+            copied += 1
+        batch.delete(index_doc.reference, option=db.write_option(last_update_time=index_doc.update_time))
+    batch.commit()
+    return copied
+
+def archive_expired(db, today, hour, shard, of, limit):
+    """將寬限期已過的聊天室搬到 archived_chats，並從 chats 與索引中刪除；回傳封存的數量。
+
+    每個聊天室的三筆寫入放在同一個 WriteBatch，不會出現只搬了一半的狀態。
+    聊天室文件已不存在的索引項目只會被刪除，不計入封存數量。
+    """
+    query = (
+        db.collection(ACTIVE_COUNTDOWNS)
+        .where(filter=FieldFilter('send_hour', '<=', hour))
+        .where(filter=FieldFilter('exam_day', '<', countdown_cutoff(today)))
+    )
+    index_docs = list(where_id_range(db, query, shard_ranges(shard, of)[0]).select([]).limit(limit).stream())
+    chats_ref = db.collection('chats')
+    archived = 0
+    for start in range(0, len(index_docs), ARCHIVE_CHUNK_SIZE):
+        chunk = index_docs[start:start + ARCHIVE_CHUNK_SIZE]
+        # get_all 不保證回傳順序，以文件 ID 對應
+        chats = {snapshot.id: snapshot for snapshot in db.get_all([chats_ref.document(doc.id) for doc in chunk])}
+        entries = [(doc, chats.get(doc.id)) for doc in chunk]
+        try:
+            archived += _archive_batch(db, entries)
+        except Exception as e:
+            # 整批失敗時逐一重試，只略過讀取後被修改過的聊天室
+            logger.warning(f"Failed to archive {len(chunk)} expired chats in one batch, retrying one by one: {e}")
+            for entry in entries:
                 try:
-                    countdown_message_text = get_countdown_message(exam_date_str)
-                    messages_to_send = [TextMessage(text=countdown_message_text)]
-                    
-                    line_bot_api.push_message(PushMessageRequest(
-                        to=chat_id,
-                        messages=messages_to_send
-                    ))
-                    logger.info(f"Successfully pushed countdown message to chat: {chat_id}")
+                    archived += _archive_batch(db, [entry])
                 except Exception as e:
-                    logger.error(f"Failed to push countdown message to chat {chat_id}: {e}")
+                    logger.info(f"Skipped archiving chat {entry[0].id}: {e}")
+    if archived:
+        logger.info(f"Archived {archived} chats whose exam ended more than {ARCHIVE_GRACE_DAYS} days ago.")
+    return archived
+
+def partition_ranges(partitions):
+    """把文件 ID 空間切成 partitions 段，回傳 [(起始 ID, 結束 ID), ...]。
+
+    聊天室 ID 為前綴 (C/R/U) 加 32 位小寫十六進位，絕大多數是使用者，
+    因此以 'U' 之後的前 8 位十六進位平均切分；數量較少的群組與聊天室 (C/R) 都落在第一段。
+    """
+    cuts = ['U' + format(i * 16 ** 8 // partitions, '08x') for i in range(1, partitions)]
+    return list(zip([None] + cuts, cuts + [None]))
+
+def shard_ranges(shard, of, partitions=1):
+    """回傳分片 shard/of 負責的文件 ID 區段，再細分成 partitions 段供並行讀取。
+
+    分片直接寫進查詢的文件 ID 範圍，每個分片只讀取 (並付費) 自己的聊天室。
+    """
+    return partition_ranges(of * partitions)[shard * partitions:(shard + 1) * partitions]
+
+def where_id_range(db, query, id_range):
+    # 加上 起始 <= 文件 ID < 結束 的範圍條件，None 表示該端不設限
+    start_id, end_id = id_range
+    if start_id is not None:
+        query = query.where(filter=FieldFilter(FieldPath.document_id(), '>=', db.collection(ACTIVE_COUNTDOWNS).document(start_id)))
+    if end_id is not None:
+        query = query.where(filter=FieldFilter(FieldPath.document_id(), '<', db.collection(ACTIVE_COUNTDOWNS).document(end_id)))
+    return query
+
+def parse_shard_params(path):
+    """從請求路徑解析 ?shard=i&of=n，未指定時回傳 (0, 1)。
+
+    參數不合法時拋出 ValueError。
+    """
+    query = parse_qs(urlparse(path).query)
+    shard = int(query.get('shard', ['0'])[0])
+    of = int(query.get('of', ['1'])[0])
+    if of < 1 or not 0 <= shard < of:
+        raise ValueError(f"shard must satisfy 0 <= shard < of, got shard={shard} of={of}")
+    return shard, of
+
+def parse_hour_param(path):
+    """從請求路徑解析 ?hour=H (台北時間 0-23)，未指定時回傳 None (使用目前的小時)。
+
+    手動補發某個時段時使用；參數不合法時拋出 ValueError。
+    """
+    query = parse_qs(urlparse(path).query)
+    if 'hour' not in query:
+        return None
+    hour = int(query['hour'][0])
+    if not 0 <= hour <= 23:
+        raise ValueError(f"hour must be between 0 and 23, got {hour}")
+    return hour
+
+def send_task(line_bot_api, task):
+    # 執行單一發送任務，不拋出例外，而是回傳結果供彙整
+    kind, message_text, recipients = task
+    started = time.perf_counter()
+    try:
+        if kind == 'multicast':
+            line_bot_api.multicast(MulticastRequest(
+                to=recipients,
+                messages=[TextMessage(text=message_text)]
+            ))
+        else:
+            line_bot_api.push_message(PushMessageRequest(
+                to=recipients[0],
+                messages=[TextMessage(text=message_text)]
+            ))
+        error = None
+    except Exception as e:
+        error = str(e)
+    return {
+        "kind": kind,
+        "recipients": recipients,
+        "error": error,
+        "elapsed": time.perf_counter() - started,
+    }
+
+def dispatch_tasks(line_bot_api, tasks, concurrency=PUSH_CONCURRENCY):
+    # 以有上限的執行緒池同時送出所有任務，結果依任務順序回傳
+    if not tasks:
+        return []
+    with ThreadPoolExecutor(max_workers=max(1, min(concurrency, len(tasks)))) as executor:
+        return list(executor.map(lambda task: send_task(line_bot_api, task), tasks))
+
+def summarize_results(results, report):
+    # 將每個任務的結果累加到 report，並整理出成功與失敗的聊天室清單
+    sent_chats = []
+    failed_chats = []
+    for result in results:
+        recipients = result["recipients"]
+        if result["error"] is None:
+            sent_chats.extend(recipients)
+            if result["kind"] == 'multicast':
+                report["multicast_calls"] += 1
+                report["multicast_recipients"] += len(recipients)
+            else:
+                report["push_calls"] += 1
+        else:
+            report["failed_calls"] += 1
+            report["failed_recipients"] += len(recipients)
+            failed_chats.extend((chat_id, result["error"]) for chat_id in recipients)
+    return sent_chats, failed_chats
+
+def mark_sent(db, chat_ids, today):
+    # 以 WriteBatch 批次在索引記錄今天已發送，失敗的聊天室不記錄，下次執行時會重試
+    sent_marks = WriteBatcher('sent_marks')
+    index_ref = db.collection(ACTIVE_COUNTDOWNS)
+    for chat_id in chat_ids:
+        sent_marks.set(index_ref.document(chat_id), {'last_sent_day': today.toordinal()}, merge=True)
+    return sent_marks.flush()
+
+def run_key(hour, shard, of):
+    return f"daily_h{hour:02d}_{shard}_of_{of}"
+
+def run_state_ref(db, hour, shard, of):
+    # 每個時段的每個分片各自記錄進度：run_date、游標 (上一頁最後一筆的排序值) 及是否已完成
+    return db.collection('job_runs').document(run_key(hour, shard, of))
+
+# --- 分散式執行鎖 ---
+# 各時段的查詢都包含較早時段還沒發送的聊天室 (send_hour <= hour)，不同 of 的分片範圍也會重疊，
+# 因此整個每日任務共用一份鎖文件，記錄所有執行中的持有者：
+# 只有 of 相同、分片不同 (文件 ID 範圍不重疊) 的執行可以同時進行，與時段無關
+JOB_LEASE_DOC = 'daily'
+
+def _live_holders(current, now):
+    # 去除已過期的持有者
+    holders = (current or {}).get('holders', {})
+    return {holder: entry for holder, entry in holders.items() if entry.get('expires_at', 0) > now}
+
+@firestore.transactional
+def _acquire_lease(transaction, lease_ref, holder, shard, of, hour, lease_seconds):
+    # 沒有範圍重疊的執行中持有者時取得；否則回傳衝突的持有者資料
+    snapshot = lease_ref.get(transaction=transaction)
+    now = time.time()
+    holders = _live_holders(snapshot.to_dict() if snapshot.exists else None, now)
+    for other_holder, other in holders.items():
+        if other_holder != holder and (other.get('of') != of or other.get('shard') == shard):
+            return False, other
+    holders[holder] = {
+        'shard': shard,
+        'of': of,
+        'hour': hour,
+        'acquired_at': now,
+        'expires_at': now + lease_seconds,
+        'progress': {},
+    }
+    transaction.set(lease_ref, {'holders': holders})
+    return True, None
+
+@firestore.transactional
+def _renew_lease(transaction, lease_ref, holder, lease_seconds, progress):
+    # 只有仍是持有者時才續約；租期已過期而被移除 (可能已被他人接手) 時回傳 False
+    snapshot = lease_ref.get(transaction=transaction)
+    now = time.time()
+    holders = _live_holders(snapshot.to_dict() if snapshot.exists else None, now)
+    if holder not in holders:
+        return False
+    holders[holder].update({'expires_at': now + lease_seconds, 'progress': progress})
+    transaction.set(lease_ref, {'holders': holders})
     return True
 
+@firestore.transactional
+def _release_lease(transaction, lease_ref, holder):
+    snapshot = lease_ref.get(transaction=transaction)
+    holders = _live_holders(snapshot.to_dict() if snapshot.exists else None, time.time())
+    if holder in holders:
+        del holders[holder]
+        transaction.set(lease_ref, {'holders': holders})
+
+class JobLease:
+    """以 Firestore transaction 實作、有租期的執行鎖，避免讀取範圍重疊的執行同時發送。
+
+    取得後由背景執行緒定期續約並寫入最新進度，讓被拒絕的呼叫端可以回報持有者的進度。
+    續約失敗直到租期過期、或發現已被移除時視為失去鎖，is_lost() 回傳 True，任務應立即停止發送。
+    """
+
+    def __init__(self, db, shard, of, hour, lease_seconds=JOB_LEASE_SECONDS):
+        self.db = db
+        self.ref = db.collection('job_leases').document(JOB_LEASE_DOC)
+        self.shard = shard
+        self.of = of
+        self.hour = hour
+        self.holder = uuid.uuid4().hex
+        self.lease_seconds = lease_seconds
+        self._progress = {}
+        self._stop = threading.Event()
+        self._lost = threading.Event()
+        self._expires_at = 0.0
+        self._heartbeat = None
+
+    def acquire(self):
+        # 回傳 (是否取得, 衝突的持有者資料)
+        acquired, current = _acquire_lease(self.db.transaction(), self.ref, self.holder, self.shard, self.of, self.hour, self.lease_seconds)
+        if acquired:
+            self._expires_at = time.time() + self.lease_seconds
+            self._heartbeat = threading.Thread(target=self._run_heartbeat, name="job-lease-heartbeat", daemon=True)
+            self._heartbeat.start()
+        return acquired, current
+
+    def update_progress(self, progress):
+        # 由執行中的任務呼叫，下一次續約時一併寫入
+        self._progress = progress
+
+    def is_lost(self):
+        # 已確認被移除，或一直續約失敗到本地記錄的租期過期
+        return self._lost.is_set() or time.time() > self._expires_at
+
+    def _run_heartbeat(self):
+        while not self._stop.wait(self.lease_seconds / 3):
+            renewed_at = time.time()
+            try:
+                if not _renew_lease(self.db.transaction(), self.ref, self.holder, self.lease_seconds, dict(self._progress)):
+                    logger.error(f"Lost job lease for shard {self.shard}/{self.of}; another run may have taken over.")
+                    self._lost.set()
+                    return
+                self._expires_at = renewed_at + self.lease_seconds
+            except Exception as e:
+                logger.warning(f"Failed to renew job lease for shard {self.shard}/{self.of}: {e}")
+
+    def release(self):
+        self._stop.set()
+        if self._heartbeat is not None:
+            self._heartbeat.join()
+        try:
+            _release_lease(self.db.transaction(), self.ref, self.holder)
+        except Exception as e:
+            # 釋放失敗時鎖會在租期到期後自動失效
+            logger.warning(f"Failed to release job lease for shard {self.shard}/{self.of}: {e}")
+
+def fetch_page(db, today, hour, cursor, page_size, id_range=(None, None)):
+    """依 (send_hour, exam_day, last_sent_day, 文件 ID) 排序分頁，較早時段留下的聊天室先發送。
+
+    cursor 為上一頁最後一筆「讀取當時」的排序值；即使該聊天室之後被標記為已發送，
+    沿用當時的值仍能正確接續，不會跳過尚未處理的聊天室。
+    id_range 為 (起始 ID, 結束 ID)，只讀取 起始 <= 文件 ID < 結束 的聊天室，None 表示不設限。
+    """
+    query = (
+        where_id_range(db, active_chats_query(db, today, hour), id_range)
+        .order_by('send_hour')
+        .order_by('exam_day')
+        .order_by('last_sent_day')
+        .order_by(FieldPath.document_id())
+        .limit(page_size)
+    )
+    if cursor:
+        query = query.start_after({
+            'send_hour': cursor['send_hour'],
+            'exam_day': cursor['exam_day'],
+            'last_sent_day': cursor['last_sent_day'],
+            FieldPath.document_id(): db.collection(ACTIVE_COUNTDOWNS).document(cursor['doc_id']),
+        })
+    return list(query.stream())
+
+def page_cursor(last_doc):
+    # 以一頁最後一筆「讀取當時」的排序值作為下一頁的游標
+    return {
+        'send_hour': last_doc.get('send_hour'),
+        'exam_day': last_doc.get('exam_day'),
+        'last_sent_day': last_doc.get('last_sent_day'),
+        'doc_id': last_doc.id,
+    }
+
+# --- 讀取與發送的管線 ---
+# 每個文件 ID 區段由一個背景執行緒逐頁讀取，頁面經由有上限的佇列交給發送端，讓 Firestore 讀取與 LINE 發送重疊
+_END_OF_PAGES = object()
+
+class PageReader:
+    """並行讀取各文件 ID 區段，依讀取完成的順序交出 (區段編號, 頁面)。
+
+    fetch(cursor, page_size, id_range) 回傳一頁文件。佇列最多暫存 prefetch 頁，
+    滿了之後讀取端會暫停 (backpressure)，記憶體用量最多約為 prefetch + 區段數 頁。
+    同一區段的頁面一定依序交出，因此發送端可以逐區段記錄游標。
+    """
+
+    def __init__(self, fetch, ranges, cursors, page_size, prefetch):
+        self.fetch = fetch
+        self.ranges = ranges
+        self.cursors = cursors
+        self.page_size = page_size
+        self._pages = queue.Queue(maxsize=max(1, prefetch))
+        self._stop = threading.Event()
+        self._threads = []
+        self._stats = [{"items": 0, "seconds": 0.0} for _ in ranges]
+        self._remaining = 0
+
+    def start(self, skip=()):
+        # skip 為今天已讀取完畢的區段
+        for partition, id_range in enumerate(self.ranges):
+            if partition in skip:
+                continue
+            thread = threading.Thread(
+                target=self._read,
+                args=(partition, id_range, self.cursors[partition]),
+                name=f"job-page-reader-{partition}",
+                daemon=True,
+            )
+            thread.start()
+            self._threads.append(thread)
+        self._remaining = len(self._threads)
+
+    def _put(self, item):
+        # 佇列已滿時等待發送端取走；發送端已停止時放棄
+        while not self._stop.is_set():
+            try:
+                self._pages.put(item, timeout=0.1)
+                return
+            except queue.Full:
+                continue
+
+    def _read(self, partition, id_range, cursor):
+        stats = self._stats[partition]
+        last_item = (partition, _END_OF_PAGES)
+        try:
+            while not self._stop.is_set():
+                started = time.monotonic()
+                docs = self.fetch(cursor, self.page_size, id_range)
+                stats["items"] += len(docs)
+                stats["seconds"] += time.monotonic() - started
+                if docs:
+                    self._put((partition, docs))
+                    cursor = page_cursor(docs[-1])
+                if len(docs) < self.page_size:
+                    break
+        except Exception as e:
+            last_item = (partition, e)
+        finally:
+            self._put(last_item)
+
+    def next_page(self, timeout):
+        """回傳下一個 (區段編號, 頁面)；全部區段讀取完畢時回傳 None。
+
+        區段讀取結束時回傳 (區段編號, [])；timeout 秒內沒有新頁面時拋出 queue.Empty，
+        讀取失敗時拋出讀取端的例外。
+        """
+        if self._remaining == 0:
+            return None
+        partition, docs = self._pages.get(timeout=timeout)
+        if isinstance(docs, Exception):
+            raise docs
+        if docs is _END_OF_PAGES:
+            self._remaining -= 1
+            return partition, []
+        return partition, docs
+
+    def close(self):
+        # 停止讀取端；已預先讀取但未發送的頁面會被捨棄，下次從游標重新讀取
+        self._stop.set()
+        for thread in self._threads:
+            thread.join()
+
+    def stats(self):
+        # 各區段並行讀取，以最慢區段的讀取時間近似整個讀取階段花費的時間
+        return {
+            "items": sum(s["items"] for s in self._stats),
+            "seconds": max((s["seconds"] for s in self._stats), default=0.0),
+        }
+
+def stage_summary(stats):
+    seconds = stats["seconds"]
+    return {
+        "items": stats["items"],
+        "seconds": round(seconds, 3),
+        "per_second": round(stats["items"] / seconds, 1) if seconds else None,
+    }
+
+# 主要的排程任務邏輯
+def execute_job(shard=0, of=1, on_progress=None, hour=None, should_stop=None):
+    """發送今天的倒數訊息，並在時間預算用完前停止。
+
+    聊天室依文件 ID 切成 JOB_PARTITIONS 個區段並行讀取，
+    每處理完一頁就記錄各聊天室的 last_sent_day 並把該區段的游標寫回 job_runs，下一次呼叫會從游標之後繼續，
+    已發送過的聊天室當天不會再被推送。全部成功的分片當天會直接略過；
+    有發送失敗時 (包含同一天先前被中斷的呼叫) 不標記完成並清除游標，下一次呼叫只會查到失敗的聊天室並重試。
+    on_progress 會在每頁處理完後收到目前的 report，供執行鎖回報進度；
+    should_stop 在每頁發送前呼叫，回傳 True 時 (例如失去執行鎖) 立即停止。
+    hour 為要發送的台北時間時段，預設為目前的小時；今天較早時段還沒發送的聊天室也會一併補發。
+    """
+    now = taipei_now()
+    if hour is None:
+        hour = now.hour
+    logger.info(f"Executing countdown message task for {hour:02d}:00 via Vercel Cron (shard {shard}/{of})...")
+    db = get_db()
+    if db is None:
+        logger.error("Firestore client not available. Skipping scheduled job.")
+        return None
+
+    started = time.monotonic()
+    deadline = started + JOB_TIME_BUDGET_SECONDS
+    renderer = CountdownRenderer(now.date())
+    today = renderer.today
+    report = {
+        "chats": 0,
+        "multicast_calls": 0,
+        "multicast_recipients": 0,
+        "push_calls": 0,
+        "failed_calls": 0,
+        "failed_recipients": 0,
+        "concurrency": PUSH_CONCURRENCY,
+        "shard": shard,
+        "of": of,
+        "run_date": today.isoformat(),
+        "hour": hour,
+        "pages": 0,
+        "resumed": False,
+        "completed": False,
+        "marked_sent": 0,
+        "archived": 0,
+    }
+
+    state_ref = run_state_ref(db, hour, shard, of)
+    state_doc = state_ref.get()
+    state = state_doc.to_dict() if state_doc.exists else {}
+    # 每個區段各自記錄游標；finished 為今天已讀取完畢的區段。區段數改變時不沿用游標，
+    # 從頭讀取也只會查到今天還沒發送的聊天室
+    cursors = [None] * JOB_PARTITIONS
+    finished = set()
+    # 這一輪 (從頭讀到尾為止，可能跨越多次呼叫) 先前呼叫的發送失敗數；不為 0 時讀完也不標記完成
+    earlier_failures = 0
+    if state.get('run_date') == today.isoformat():
+        if state.get('done'):
+            logger.info(f"Job for {today} {hour:02d}:00 (shard {shard}/{of}) already completed. Nothing to do.")
+            report["completed"] = True
+            return report
+        earlier_failures = state.get('failed_recipients', 0)
+        if state.get('partitions') == JOB_PARTITIONS:
+            cursors = state.get('cursors') or cursors
+            finished = set(state.get('finished') or [])
+            if finished or any(cursors):
+                report["resumed"] = True
+                logger.info(f"Resuming daily job: {len(finished)}/{JOB_PARTITIONS} partitions finished.")
+
+    def save_state(done=False, failed_recipients=None):
+        if failed_recipients is None:
+            failed_recipients = earlier_failures + len(failed_chats)
+        state_ref.set({
+            'run_date': today.isoformat(),
+            'partitions': JOB_PARTITIONS,
+            'cursors': cursors,
+            'finished': sorted(finished),
+            'failed_recipients': failed_recipients,
+            'done': done,
+        })
+
+    failed_chats = []
+    slowest_page = 0.0
+    line_bot_api = get_messaging_api()
+    send_stats = {"items": 0, "seconds": 0.0}
+    mark_stats = {"items": 0, "seconds": 0.0}
+    waited = 0.0
+
+    reader = PageReader(
+        partial(fetch_page, db, today, hour),
+        shard_ranges(shard, of, JOB_PARTITIONS),
+        cursors,
+        JOB_PAGE_SIZE,
+        JOB_PREFETCH_PAGES,
+    )
+    reader.start(skip=finished)
+    try:
+        while True:
+            # 預留至少一頁最慢處理時間，確保來得及寫回游標再結束
+            if time.monotonic() + slowest_page > deadline:
+                logger.warning(f"Time budget of {JOB_TIME_BUDGET_SECONDS}s nearly exhausted; stopping after {report['pages']} pages.")
+                break
+
+            wait_started = time.monotonic()
+            try:
+                page = reader.next_page(timeout=max(0.0, deadline - wait_started))
+            except queue.Empty:
+                logger.warning(f"Time budget of {JOB_TIME_BUDGET_SECONDS}s exhausted while waiting for Firestore; stopping after {report['pages']} pages.")
+                break
+            waited += time.monotonic() - wait_started
+            if page is None:
+                report["completed"] = True
+                break
+            partition, docs = page
+            if not docs:
+                finished.add(partition)
+                save_state()
+                continue
+
+            # 發送前確認仍持有執行鎖，避免與接手的執行重複推送
+            if should_stop is not None and should_stop():
+                logger.error(f"Stopping daily job after {report['pages']} pages: job lease lost.")
+                report["lease_lost"] = True
+                break
+
+            page_started = time.monotonic()
+            tasks = build_send_plan(docs, renderer)
+            page_chats = sum(len(recipients) for _, _, recipients in tasks)
+            report["chats"] += page_chats
+            results = dispatch_tasks(line_bot_api, tasks)
+            send_stats["items"] += page_chats
+            send_stats["seconds"] += time.monotonic() - page_started
+
+            sent_chats, page_failed = summarize_results(results, report)
+            failed_chats.extend(page_failed)
+            mark_started = time.monotonic()
+            marked = mark_sent(db, sent_chats, today)
+            report["marked_sent"] += marked
+            mark_stats["items"] += marked
+            mark_stats["seconds"] += time.monotonic() - mark_started
+
+            cursors[partition] = page_cursor(docs[-1])
+            save_state()
+            report["pages"] += 1
+            slowest_page = max(slowest_page, time.monotonic() - page_started)
+            if on_progress is not None:
+                on_progress(dict(report))
+    finally:
+        reader.close()
+
+    report["partitions"] = JOB_PARTITIONS
+    report["stages"] = {
+        "read": stage_summary(reader.stats()),
+        "send": stage_summary(send_stats),
+        "mark": stage_summary(mark_stats),
+        "send_waiting_for_reads_seconds": round(waited, 3),
+    }
+
+    if report["completed"]:
+        # 讀完一輪後清除游標與失敗數，有失敗時下一輪從頭讀取，只會查到失敗的聊天室
+        cursors[:] = [None] * JOB_PARTITIONS
+        finished.clear()
+        save_state(done=not (earlier_failures or failed_chats), failed_recipients=0)
+        if time.monotonic() < deadline:
+            report["archived"] = archive_expired(db, today, hour, shard, of, JOB_PAGE_SIZE)
+
+    report["elapsed_seconds"] = round(time.monotonic() - started, 3)
+    if failed_chats:
+        logger.error(f"Failed to send countdown message to {len(failed_chats)} chats: {failed_chats}")
+    logger.info(f"Daily job finished: {report}")
+    return report
+
+log_cold_start('api/send_daily_job')
+
 # Vercel Serverless Function 的標準入口
 class handler(BaseHTTPRequestHandler):
     def do_GET(self):
@@ -66,14 +700,70 @@ class handler(BaseHTTPRequestHandler):
             self.wfile.write(json.dumps({"status": "error", "message": "Unauthorized"}).encode('utf-8'))
             return
 
+        # 解析分片參數 (?shard=i&of=n)，讓多個排程或平行呼叫分攤所有聊天室；
+        # 以及時段參數 (?hour=H)，未指定時發送目前這個小時的分桶
+        try:
+            shard, of = parse_shard_params(self.path)
+            hour = parse_hour_param(self.path)
+        except ValueError as e:
+            self.send_response(400) # 400 Bad Request
+            self.send_header('Content-type', 'application/json')
+            self.end_headers()
+            self.wfile.write(json.dumps({"status": "error", "message": f"Invalid parameters: {e}"}).encode('utf-8'))
+            return
+
+        # 取得此分片的執行鎖；已有範圍重疊的執行 (任何時段) 進行中時立即回傳 409 與對方的進度
+        if hour is None:
+            hour = taipei_now().hour
+        db = get_db()
+        lease = None
+        if db is not None:
+            lease = JobLease(db, shard, of, hour)
+            try:
+                acquired, current = lease.acquire()
+            except Exception as e:
+                logger.error(f"Failed to acquire job lease: {e}")
+                self.send_response(500)
+                self.send_header('Content-type', 'application/json')
+                self.end_headers()
+                self.wfile.write(json.dumps({"status": "error", "message": "Could not acquire job lease."}).encode('utf-8'))
+                return
+            if not acquired:
+                self.send_response(409) # 409 Conflict
+                self.send_header('Content-type', 'application/json')
+                self.end_headers()
+                self.wfile.write(json.dumps({
+                    "status": "busy",
+                    "message": "Another run of this job is in progress.",
+                    "holder": {"shard": current.get('shard'), "of": current.get('of'), "hour": current.get('hour')},
+                    "expires_in_seconds": round(current.get('expires_at', 0) - time.time(), 1),
+                    "progress": current.get('progress', {}),
+                }).encode('utf-8'))
+                return
+
         # 驗證通過，執行主要任務
-        success = execute_job()
+        try:
+            report = execute_job(
+                shard, of,
+                on_progress=lease.update_progress if lease else None,
+                hour=hour,
+                should_stop=lease.is_lost if lease else None,
+            )
+        finally:
+            if lease is not None:
+                lease.release()
         
-        if success:
+        if report is not None:
             self.send_response(200)
             self.send_header('Content-type', 'application/json')
             self.end_headers()
-            self.wfile.write(json.dumps({"status": "success", "message": "Job executed successfully."}).encode('utf-8'))
+            if report["completed"]:
+                body = {"status": "success", "message": "Job executed successfully.", "report": report}
+            elif report.get("lease_lost"):
+                body = {"status": "partial", "message": "Job lease lost; stopped before sending more pages.", "report": report}
+            else:
+                body = {"status": "partial", "message": "Time budget reached; the remaining chats are sent by the next invocation or the next hourly run.", "report": report}
+            self.wfile.write(json.dumps(body).encode('utf-8'))
         else:
             self.send_response(500)
             self.send_header('Content-type', 'application/json')
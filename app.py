@@ -1,182 +1,353 @@
-import os
-from datetime import datetime
-import json
 import logging
-from flask import Flask, request, abort
-
-# 引入 Firebase Admin SDK 相關模組
-import firebase_admin
-from firebase_admin import credentials, firestore
-from firebase_admin import exceptions as firebase_exceptions
-
-import pytz 
-from datetime import datetime
-
-from linebot.v3 import (
-    WebhookHandler
-)
-from linebot.v3.exceptions import (
-    InvalidSignatureError
-)
-from linebot.v3.messaging import (
-    Configuration,
-    ApiClient,
-    MessagingApi,
-    ReplyMessageRequest,
-    TextMessage,
-    PushMessageRequest,
-    ImageMessage,
-    StickerMessage
-)
-from linebot.v3.webhooks import (
-    MessageEvent,
-    TextMessageContent,
-    FollowEvent,
-    JoinEvent
-)
+import os
+import queue
+import random
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+
+# Firebase 初始化、LINE 設定與訊息產生邏輯放在 core.py，與排程任務共用
+from core import DEFAULT_SEND_HOUR, active_countdown_ref, countdown_cutoff, taipei_today, get_db, get_messaging_api, WriteBatcher, logger, get_countdown_message, timed_import, log_cold_start
+from webhook_utils import metrics, TTLCache, KeyedExecutor
+
+from commands import router
+
+with timed_import('flask'):
+    from flask import Flask, request, abort, jsonify
+
+with timed_import('linebot'):
+    from linebot.v3 import (
+        WebhookHandler
+    )
+    from linebot.v3.exceptions import (
+        InvalidSignatureError
+    )
+    from linebot.v3.messaging import (
+        ReplyMessageRequest,
+        TextMessage,
+        PushMessageRequest,
+        ImageMessage,
+        StickerMessage
+    )
+    from linebot.v3.webhooks import (
+        MessageEvent,
+        TextMessageContent,
+        FollowEvent,
+        JoinEvent
+    )
 
 app = Flask(__name__)
 
-logging.basicConfig(level=logging.INFO)
-logger = logging.getLogger(__name__)
+class EventDispatcher(WebhookHandler):
+    """WebhookHandler 只提供「驗證 + 依序處理整包事件」的 handle()；
+    這裡補上單一事件的分派，讓已驗證的事件可以交給背景 worker 處理。
+    查找規則與 WebhookHandler.handle() 相同：先找 (事件, 訊息類型)，再找事件，最後是 default。
+    """
 
-configuration = Configuration(access_token=os.getenv('CHANNEL_ACCESS_TOKEN'))
-line_handler = WebhookHandler(os.getenv('CHANNEL_SECRET'))
+    def dispatch(self, event):
+        func = None
+        if isinstance(event, MessageEvent):
+            func = self._handlers.get(f"{event.__class__.__name__}_{event.message.__class__.__name__}")
+        if func is None:
+            func = self._handlers.get(event.__class__.__name__)
+        if func is None:
+            func = self._default
+        if func is None:
+            logger.info(f"No handler for {event.__class__.__name__} and no default handler")
+            return
+        func(event)
 
-# --- Firebase 初始化 (維持不變) ---
-db = None
-cred = None
-try:
-    service_account_json_str = os.getenv('FIREBASE_SERVICE_ACCOUNT_KEY_JSON')
-    if service_account_json_str:
-        service_account_info = json.loads(service_account_json_str)
-        cred = credentials.Certificate(service_account_info)
-    else:
-        raise ValueError("FIREBASE_SERVICE_ACCOUNT_KEY_JSON environment variable is not set.")
-    firebase_admin.initialize_app(cred)
-    db = firestore.client()
-    logger.info("Firebase app initialized and Firestore client created.")
-except (ValueError, json.JSONDecodeError, firebase_exceptions.FirebaseError, Exception) as e:
-    logger.critical(f"FATAL ERROR: Could not initialize Firebase or Firestore: {e}")
-    db = None
-
-# --- 訊息生成函數 (維持不變) ---
-def get_countdown_message(exam_date_str):
-    if not exam_date_str:
-        return "很抱歉，尚未設定考試日期。請輸入'設定考試日期 YYYY-MM-DD'來設定。"
-    try:    
-        # 1. 定義台北時區
-        taipei_tz = pytz.timezone("Asia/Taipei")
-
-        # 2. 處理考試日期，並使其具有時區資訊
-        exam_date_naive = datetime.strptime(exam_date_str, "%Y-%m-%d")
-        exam_date_aware = taipei_tz.localize(exam_date_naive)
-
-        # 3. 取得當下台北時間，並標準化為當天零點
-        today_aware = datetime.now(taipei_tz)
-        
-        # 4. 進行日期相減，變數名稱需保持一致
-        #    為了確保天數計算精確，我們只比較日期，不比較時間
-        time_left = exam_date_aware.date() - today_aware.date()
-        
-        # 5. 從結果中取得天數
-        days_left = time_left.days
-        
-        if days_left > 0:
-            message = ""
-            if days_left == 100: message = f"⌛時光飛逝，你只剩下{days_left} 天，趕快拿起書本來📚📚"
-            elif days_left == 90: message = f"沒想到已經剩下{days_left} 天\n｡ﾟヽ(ﾟ´Д`)ﾉﾟ｡時間都在我的睡夢中流失了！"
-            elif days_left == 30: message = f"距離考試只剩下 {days_left} 天！\n祝你考試像打遊戲一樣，一路都是暴擊，分數直接爆表！🔥🔥"
-            elif days_left == 10: message = f"距離考試只剩下 {days_left} 天！\n祝你考試像吃雞腿一樣，輕鬆又美味，分數高高🍗"
-            else: message = f"你今天讀書了嗎？💥\n距離考試只剩下 {days_left} 天！加油！💪💪💪"
-        elif days_left == 0: message = f"你今天讀書了嗎？\n今天是考試的日子🏆金榜題名🏆"
-        else: message = f"考試 ({exam_date_str}) 已經在 {abs(days_left)} 天前結束了。期待你下次的挑戰！"
-        return message
-    except ValueError:
-        return "考試日期格式錯誤，請檢查設定或重新設定。正確格式為YYYY-MM-DD。"
-
-# --- LINE Bot Webhook 回調入口 (維持不變) ---
+line_handler = EventDispatcher(os.getenv('CHANNEL_SECRET'))
+
+# --- 背景事件佇列 (WEBHOOK_ASYNC=1 時啟用) ---
+# /callback 驗證簽章後只把事件放進佇列就立刻回 200，由固定數量的 worker 處理 Firestore 與回覆，
+# 避免慢速的 Firestore 呼叫拖過 LINE 的 webhook 逾時而觸發重送。
+# 注意：Serverless 平台可能在回應送出後凍結執行個體，請在會持續執行的環境中使用此模式。
+WEBHOOK_ASYNC = os.getenv('WEBHOOK_ASYNC', '0') == '1'
+WEBHOOK_WORKERS = int(os.getenv('WEBHOOK_WORKERS', '4'))
+WEBHOOK_QUEUE_SIZE = int(os.getenv('WEBHOOK_QUEUE_SIZE', '1000'))
+
+_event_queue = queue.Queue(maxsize=WEBHOOK_QUEUE_SIZE)
+_workers_started = False
+_workers_lock = threading.Lock()
+
+# 同一包 webhook 中不同聊天室的事件並行處理，同一聊天室的事件仍依序處理
+EVENT_CONCURRENCY = int(os.getenv('EVENT_CONCURRENCY', '8'))
+_event_executor = KeyedExecutor(EVENT_CONCURRENCY, thread_name_prefix='chat-event')
+
+def event_chat_key(event):
+    source = event.source
+    if source is None:
+        return None
+    return getattr(source, 'group_id', None) or getattr(source, 'room_id', None) or getattr(source, 'user_id', None)
+
+# --- 重送事件的去重 ---
+# LINE 在 webhook 回應太慢時會重送事件；以 webhookEventId 記錄已處理的事件，
+# 重送的事件在任何處理器執行前就丟棄。記憶體 LRU 只涵蓋同一個執行個體，
+# WEBHOOK_DEDUP_STORE=firestore 時另外在 webhook_events 集合建立紀錄，跨執行個體去重
+# (需在 Firestore 主控台對 expire_at 欄位設定 TTL 政策，過期紀錄才會自動刪除)
+WEBHOOK_DEDUP_STORE = os.getenv('WEBHOOK_DEDUP_STORE', 'memory')
+WEBHOOK_DEDUP_TTL = float(os.getenv('WEBHOOK_DEDUP_TTL', '86400'))
+WEBHOOK_DEDUP_SIZE = int(os.getenv('WEBHOOK_DEDUP_SIZE', '10000'))
+seen_events = TTLCache(WEBHOOK_DEDUP_SIZE, WEBHOOK_DEDUP_TTL)
+
+def is_duplicate_event(event):
+    event_id = getattr(event, 'webhook_event_id', None)
+    if not event_id:
+        return False
+    if not seen_events.add(event_id):
+        return True
+    if WEBHOOK_DEDUP_STORE == 'firestore':
+        # 只有使用 Firestore 去重時才需要載入 google.api_core
+        from google.api_core.exceptions import AlreadyExists
+        expire_at = datetime.now(timezone.utc) + timedelta(seconds=WEBHOOK_DEDUP_TTL)
+        try:
+            get_db().collection('webhook_events').document(event_id).create({'expire_at': expire_at})
+        except AlreadyExists:
+            return True
+        except Exception as e:
+            # 去重紀錄寫入失敗時仍處理事件，寧可重複回覆也不要漏掉
+            logger.warning(f"Could not record webhook event {event_id} for deduplication: {e}")
+    return False
+
+def handle_event(event):
+    # 重送的事件直接丟棄；單一事件失敗不影響其他事件
+    if is_duplicate_event(event):
+        metrics.incr('webhook_duplicate_events')
+        logger.info(f"Dropping redelivered webhook event {event.webhook_event_id}.")
+        return
+    try:
+        line_handler.dispatch(event)
+    except Exception as e:
+        logger.exception(f"Failed to handle {event.__class__.__name__}: {e}")
+
+# 加入好友 / 加入群組時的文件寫入先累積起來，每包 webhook 處理完再以單一 WriteBatch 提交，
+# 大量加入時 (活動、QR code 散佈) 不會變成一連串的單筆寫入。
+# 文字指令處理前會先提交同一聊天室的待寫入資料 (見 handle_message)
+chat_writes = WriteBatcher('chat_writes', metrics)
+
+def process_events(events):
+    # 處理一包已驗證的事件，等全部完成後才回傳；總延遲約等於最慢的聊天室，而不是所有事件的總和
+    try:
+        if len(events) == 1:
+            handle_event(events[0])
+            return
+        futures = [_event_executor.submit(event_chat_key(event), handle_event, event) for event in events]
+        for future in futures:
+            future.result()
+    finally:
+        chat_writes.flush()
+
+def _event_worker():
+    while True:
+        events, enqueued_at = _event_queue.get()
+        lag_ms = int((time.monotonic() - enqueued_at) * 1000)
+        metrics.incr('webhook_lag_ms_total', lag_ms)
+        metrics.record_max('webhook_lag_ms_max', lag_ms)
+        try:
+            process_events(events)
+        finally:
+            metrics.incr('webhook_payloads_processed')
+            _event_queue.task_done()
+
+def _ensure_workers():
+    global _workers_started
+    if not _workers_started:
+        with _workers_lock:
+            if not _workers_started:
+                for i in range(WEBHOOK_WORKERS):
+                    threading.Thread(target=_event_worker, name=f"webhook-worker-{i}", daemon=True).start()
+                _workers_started = True
+
+def enqueue_events(events):
+    # 佇列已滿時退回同步處理，不丟棄事件
+    _ensure_workers()
+    try:
+        _event_queue.put_nowait((events, time.monotonic()))
+        metrics.incr('webhook_payloads_enqueued')
+    except queue.Full:
+        metrics.incr('webhook_queue_full')
+        logger.warning("Webhook event queue is full; handling events synchronously.")
+        process_events(events)
+
+# --- Webhook 內容的取樣日誌 ---
+# 只記錄部分請求的內容並截斷長度，避免高流量時每個請求都組字串、寫日誌
+WEBHOOK_LOG_SAMPLE_RATE = float(os.getenv('WEBHOOK_LOG_SAMPLE_RATE', '0.01'))
+WEBHOOK_LOG_MAX_CHARS = int(os.getenv('WEBHOOK_LOG_MAX_CHARS', '1000'))
+
+def log_webhook_body(body):
+    if WEBHOOK_LOG_SAMPLE_RATE <= 0 or not app.logger.isEnabledFor(logging.INFO):
+        return
+    if WEBHOOK_LOG_SAMPLE_RATE < 1 and random.random() >= WEBHOOK_LOG_SAMPLE_RATE:
+        return
+    # 以 % 參數延遲格式化，由背景的日誌執行緒輸出
+    app.logger.info(
+        "webhook_body size=%d truncated=%s sample_rate=%s body=%s",
+        len(body), len(body) > WEBHOOK_LOG_MAX_CHARS, WEBHOOK_LOG_SAMPLE_RATE, body[:WEBHOOK_LOG_MAX_CHARS],
+    )
+
+# --- LINE Bot Webhook 回調入口 ---
 @app.route("/callback", methods=['POST'])
 def callback():
-    # ... 此函數的程式碼完全不變 ...
     signature = request.headers['X-Line-Signature']
     body = request.get_data(as_text=True)
-    app.logger.info("Request body: " + body)
+    log_webhook_body(body)
     try:
-        line_handler.handle(body, signature)
+        payload = line_handler.parser.parse(body, signature, as_payload=True)
     except InvalidSignatureError:
         app.logger.info("Invalid signature. Please check your channel access token/channel secret.")
         abort(400)
+    if WEBHOOK_ASYNC:
+        enqueue_events(payload.events)
+    else:
+        process_events(payload.events)
     return 'OK'
 
+# --- 執行個體計數器 ---
+@app.route("/metrics", methods=['GET'])
+def metrics_endpoint():
+    # 與排程任務相同，若有設定 CRON_SECRET 就要求 Bearer 驗證
+    cron_secret = os.getenv('CRON_SECRET')
+    if cron_secret and request.headers.get('Authorization') != f"Bearer {cron_secret}":
+        abort(401)
+    snapshot = metrics.snapshot()
+    snapshot['webhook_queue_depth'] = _event_queue.qsize()
+    snapshot['exam_date_cache'] = exam_date_cache.stats()
+    return jsonify(snapshot)
+
 # --- 【已移除】/wakeup 端點，因為不再需要外部服務來喚醒 ---
 
-# --- LINE 訊息與事件處理 (維持不變) ---
+# --- 考試日期的讀取快取 ---
+# 同一個聊天室短時間內多次查詢時不必每次都讀 Firestore；設定或重設日期時同步更新快取。
+# 快取只存在於單一執行個體，其他執行個體寫入的變更最多延遲 TTL 秒才會看到
+EXAM_DATE_CACHE_TTL = float(os.getenv('EXAM_DATE_CACHE_TTL', '60'))
+EXAM_DATE_CACHE_SIZE = int(os.getenv('EXAM_DATE_CACHE_SIZE', '1024'))
+exam_date_cache = TTLCache(EXAM_DATE_CACHE_SIZE, EXAM_DATE_CACHE_TTL)
+
+def get_exam_date(source_id):
+    # 回傳 (exam_date, exam_day)，未設定時為 (None, None)
+    cached = exam_date_cache.get(source_id)
+    if cached is not None:
+        return cached
+    doc = get_db().collection('chats').document(source_id).get()
+    chat_data = doc.to_dict() if doc.exists else {}
+    cached = (chat_data.get('exam_date'), chat_data.get('exam_day'))
+    exam_date_cache.set(source_id, cached)
+    return cached
+
+# --- 文字指令的執行 ---
+# 解析 (文字 → intent) 由 commands.router 負責；這裡依 intent 種類查表執行對應的 I/O，
+# 每個執行函數回傳要回覆給使用者的文字
+def run_set_exam_date(source_id, args):
+    db = get_db()
+    doc_ref = db.collection('chats').document(source_id)
+    data = {'exam_date': args['exam_date'], 'exam_day': args['exam_day']}
+    # 一次讀取聊天室的 send_hour 與索引的 last_sent_day (兩份文件的 ID 都是聊天室 ID，以路徑區分)
+    index_ref = active_countdown_ref(db, source_id)
+    snapshots = {snapshot.reference.path: snapshot.to_dict() or {} for snapshot in db.get_all([doc_ref, index_ref], field_paths=['send_hour', 'last_sent_day'])}
+    # 尚未設定提醒時間的聊天室沿用封存前的設定 (考試結束後被封存的聊天室)，都沒有時補上預設值
+    send_hour = snapshots.get(doc_ref.path, {}).get('send_hour')
+    if send_hour is None:
+        archived = db.collection('archived_chats').document(source_id).get(field_paths=['send_hour'])
+        send_hour = data['send_hour'] = (archived.to_dict() or {}).get('send_hour', DEFAULT_SEND_HOUR)
+    # 聊天室文件與 active_countdowns 索引在同一個批次中寫入；
+    # 新的索引項目 last_sent_day 設為 0 讓排程查詢 (last_sent_day < 今天) 能找到這個聊天室，
+    # 已有的項目保留原值，今天已發送過的聊天室重新設定日期後不會再被推送一次
+    last_sent_day = snapshots.get(index_ref.path, {}).get('last_sent_day', 0)
+    batch = db.batch()
+    batch.set(doc_ref, data, merge=True)
+    if args['exam_day'] >= countdown_cutoff(taipei_today()):
+        batch.set(index_ref, {'exam_day': args['exam_day'], 'send_hour': send_hour, 'last_sent_day': last_sent_day})
+    else:
+        batch.delete(index_ref)
+    batch.commit()
+    exam_date_cache.set(source_id, (args['exam_date'], args['exam_day']))
+    return f"專屬於您的考試日期已設定為：{args['exam_date']}"
+
+def run_query_countdown(source_id, args):
+    exam_date, exam_day = get_exam_date(source_id)
+    return get_countdown_message(exam_date, exam_day)
+
+def run_set_send_hour(source_id, args):
+    db = get_db()
+    batch = db.batch()
+    batch.set(db.collection('chats').document(source_id), {'send_hour': args['send_hour']}, merge=True)
+    # 還在倒數的聊天室同時搬到新的時段分桶
+    exam_date, exam_day = get_exam_date(source_id)
+    if exam_day is not None and exam_day >= countdown_cutoff(taipei_today()):
+        batch.set(active_countdown_ref(db, source_id), {'send_hour': args['send_hour']}, merge=True)
+    batch.commit()
+    return f"每日提醒時間已設定為：{args['send_hour']:02d}:00 (台北時間)"
+
+def run_reply(source_id, args):
+    return args['text']
+
+INTENT_HANDLERS = {
+    'set_exam_date': run_set_exam_date,
+    'query_countdown': run_query_countdown,
+    'set_send_hour': run_set_send_hour,
+    'reply': run_reply,
+}
+
+# --- LINE 訊息與事件處理 ---
 @line_handler.add(MessageEvent, message=TextMessageContent)
 def handle_message(event):
-    # ... 此函數的程式碼完全不變 ...
-    with ApiClient(configuration) as api_client:
-        line_bot_api = MessagingApi(api_client)
-        text = event.message.text
-        source_id = event.source.group_id if event.source.type == 'group' else event.source.user_id
-        if not source_id:
-            logger.error("Could not determine source ID from event.")
-            return
-        doc_ref = db.collection('chats').document(source_id)
-        if text.startswith("設定考試日期"):
-            parts = text.split()
-            if len(parts) == 2:
-                date_str = parts[1]
-                try:
-                    datetime.strptime(date_str, "%Y-%m-%d")
-                    doc_ref.set({'exam_date': date_str}, merge=True)
-                    line_bot_api.reply_message_with_http_info(ReplyMessageRequest(reply_token=event.reply_token, messages=[TextMessage(text=f"專屬於您的考試日期已設定為：{date_str}")]))
-                except ValueError:
-                    line_bot_api.reply_message_with_http_info(ReplyMessageRequest(reply_token=event.reply_token, messages=[TextMessage(text="日期格式不正確，請使用YYYY-MM-DD。")]))
-            else:
-                line_bot_api.reply_message_with_http_info(ReplyMessageRequest(reply_token=event.reply_token, messages=[TextMessage(text="請輸入正確指令：設定考試日期 YYYY-MM-DD")]))
-        elif text == "查詢剩餘天數":
-            doc = doc_ref.get()
-            exam_date_str = doc.to_dict().get('exam_date') if doc.exists else None
-            countdown_message = get_countdown_message(exam_date_str)
-            line_bot_api.reply_message_with_http_info(ReplyMessageRequest(reply_token=event.reply_token, messages=[TextMessage(text=countdown_message)]))
+    # 群組中的一般聊天訊息在建立任何 client 或 Firestore 物件之前就直接略過
+    intent = router.parse(event.message.text)
+    if intent is None:
+        metrics.incr('messages_filtered')
+        return
+    metrics.incr('messages_handled')
+
+    source_id = event.source.group_id if event.source.type == 'group' else event.source.user_id
+    if not source_id:
+        logger.error("Could not determine source ID from event.")
+        return
+    # 同一聊天室還在批次中的加入好友/群組寫入先提交，之後的讀取與直接寫入才不會被它覆蓋
+    if intent.name != 'reply':
+        chat_writes.flush(source_id)
+    reply_text = INTENT_HANDLERS[intent.name](source_id, intent.args)
+    line_bot_api = get_messaging_api()
+    line_bot_api.reply_message_with_http_info(ReplyMessageRequest(reply_token=event.reply_token, messages=[TextMessage(text=reply_text)]))
 
 @line_handler.add(FollowEvent)
 def handle_follow(event):
-    # ... 此函數的程式碼完全不變 ...
     user_id = event.source.user_id
-    doc_ref = db.collection('chats').document(user_id)
-    doc_ref.set({'type': 'user', 'exam_date': None}, merge=True)
-    logger.info(f"User document created/updated in Firestore for user: {user_id}")
-    with ApiClient(configuration) as api_client:
-        line_bot_api = MessagingApi(api_client)
+    doc_ref = get_db().collection('chats').document(user_id)
+    chat_writes.set(doc_ref, {'type': 'user', 'exam_date': None, 'exam_day': None}, merge=True)
+    chat_writes.delete(active_countdown_ref(get_db(), user_id))
+    exam_date_cache.pop(user_id)
+    logger.info(f"User document queued for creation/update in Firestore for user: {user_id}")
+    line_bot_api = get_messaging_api()
+    messages = [
+        TextMessage(text="哈囉！謝謝你加入這個倒數計時小幫手😎！\n\n🍊你可以輸入: \n【設定考試日期YYYY-MM-DD】來設定你的重要日期\n\n例如：\n'設定考試日期 2025-10-26'\n\n🍊隨時輸入 '查詢剩餘天數' 就能知道距離考試還有多久喔！\n\n🍊輸入【設定提醒時間 HH】可以調整每天提醒的時間 (預設早上 7 點)\n\n準備好了嗎？我們一起努力！\nd(`･∀･)b"),
+        StickerMessage(package_id='11538', sticker_id='51626494')
+    ]
+    try:
+        line_bot_api.reply_message_with_http_info(ReplyMessageRequest(reply_token=event.reply_token, messages=messages))
+    except Exception as e:
+        logger.error(f"Failed to send welcome message to user {user_id}: {e}")
+
+@line_handler.add(JoinEvent)
+def handle_join(event):
+    if event.source.type == "group":
+        group_id = event.source.group_id
+        doc_ref = get_db().collection('chats').document(group_id)
+        chat_writes.set(doc_ref, {'type': 'group', 'exam_date': None, 'exam_day': None}, merge=True)
+        chat_writes.delete(active_countdown_ref(get_db(), group_id))
+        exam_date_cache.pop(group_id)
+        logger.info(f"Group document queued for creation in Firestore for group: {group_id}")
+        line_bot_api = get_messaging_api()
         messages = [
-            TextMessage(text="哈囉！謝謝你加入這個倒數計時小幫手😎！\n\n🍊你可以輸入: \n【設定考試日期YYYY-MM-DD】來設定你的重要日期\n\n例如：\n'設定考試日期 2025-10-26'\n\n🍊隨時輸入 '查詢剩餘天數' 就能知道距離考試還有多久喔！\n\n準備好了嗎？我們一起努力！\nd(`･∀･)b"),
+            TextMessage(text="哈囉！大家好！\n我是你們的倒數計時小幫手😎，很高興加入這個群組！\n\n🍊群組裡面的任何一位成員都可以輸入【設定考試日期YYYY-MM-DD】來設定日期\n\n例如：\n'設定考試日期 2025-10-26'\n\n🍊隨時輸入【查詢剩餘天數】就能知道距離考試還有多久喔！\n\n🍊輸入【設定提醒時間 HH】可以調整每天提醒的時間 (預設早上 7 點)\n\n讓我們一起為目標衝刺吧！\nd(`･∀･)b"),
             StickerMessage(package_id='11538', sticker_id='51626494')
         ]
         try:
             line_bot_api.reply_message_with_http_info(ReplyMessageRequest(reply_token=event.reply_token, messages=messages))
         except Exception as e:
-            logger.error(f"Failed to send welcome message to user {user_id}: {e}")
+            logger.error(f"Failed to send welcome message to group {group_id}: {e}")
 
-@line_handler.add(JoinEvent)
-def handle_join(event):
-    # ... 此函數的程式碼完全不變 ...
-    if event.source.type == "group":
-        group_id = event.source.group_id
-        doc_ref = db.collection('chats').document(group_id)
-        doc_ref.set({'type': 'group', 'exam_date': None}, merge=True)
-        logger.info(f"Group document created in Firestore for group: {group_id}")
-        with ApiClient(configuration) as api_client:
-            line_bot_api = MessagingApi(api_client)
-            messages = [
-                TextMessage(text="哈囉！大家好！\n我是你們的倒數計時小幫手😎，很高興加入這個群組！\n\n🍊群組裡面的任何一位成員都可以輸入【設定考試日期YYYY-MM-DD】來設定日期\n\n例如：\n'設定考試日期 2025-10-26'\n\n🍊隨時輸入【查詢剩餘天數】就能知道距離考試還有多久喔！\n\n讓我們一起為目標衝刺吧！\nd(`･∀･)b"),
-                StickerMessage(package_id='11538', sticker_id='51626494')
-            ]
-            try:
-                line_bot_api.reply_message_with_http_info(ReplyMessageRequest(reply_token=event.reply_token, messages=messages))
-            except Exception as e:
-                logger.error(f"Failed to send welcome message to group {group_id}: {e}")
+log_cold_start('app')
 
 # --- 程式的入口點 (維持不變) ---
 if __name__ == "__main__":
@@ -0,0 +1,76 @@
+"""文字指令的解析與路由。
+
+這裡只負責「文字 → intent」的純函數階段，不會碰到 LINE 或 Firestore，
+可以單獨測試與量測效能；實際的回覆與資料庫寫入由 app.py 依 intent 執行。
+"""
+from collections import namedtuple
+from datetime import datetime
+
+# name 為 intent 種類，args 為解析出的參數 (dict)
+Intent = namedtuple('Intent', ['name', 'args'])
+
+class CommandRouter:
+    """以關鍵字註冊指令，查找時只需對每種關鍵字長度做一次 dict 查詢。
+
+    關鍵字數量增加時，查找成本只與「不同的關鍵字長度」有關，不會逐一比對每個指令。
+    """
+
+    def __init__(self):
+        self._commands = {}
+        self._lengths = ()
+
+    def command(self, keyword, exact=False):
+        # 註冊指令解析器；exact=True 時訊息必須與關鍵字完全相同，否則以關鍵字開頭即可
+        def decorator(parser):
+            self._commands[keyword] = (parser, exact)
+            self._lengths = tuple(sorted({len(k) for k in self._commands}, reverse=True))
+            return parser
+        return decorator
+
+    def parse(self, text):
+        """回傳 text 對應的 Intent，不是指令時回傳 None。"""
+        for length in self._lengths:
+            entry = self._commands.get(text[:length])
+            if entry is None:
+                continue
+            parser, exact = entry
+            if exact and len(text) != length:
+                continue
+            return parser(text)
+        return None
+
+router = CommandRouter()
+
+def reply(text):
+    # 只需要回覆固定訊息的 intent (例如格式錯誤的提示)
+    return Intent('reply', {'text': text})
+
+@router.command("設定考試日期")
+def parse_set_exam_date(text):
+    parts = text.split()
+    if len(parts) != 2:
+        return reply("請輸入正確指令：設定考試日期 YYYY-MM-DD")
+    date_str = parts[1]
+    try:
+        exam_day = datetime.strptime(date_str, "%Y-%m-%d").date().toordinal()
+    except ValueError:
+        return reply("日期格式不正確，請使用YYYY-MM-DD。")
+    return Intent('set_exam_date', {'exam_date': date_str, 'exam_day': exam_day})
+
+@router.command("查詢剩餘天數", exact=True)
+def parse_query_countdown(text):
+    return Intent('query_countdown', {})
+
+@router.command("設定提醒時間")
+def parse_set_send_hour(text):
+    # 接受 7、07 或 07:00 (只支援整點)
+    parts = text.split()
+    if len(parts) != 2:
+        return reply("請輸入正確指令：設定提醒時間 HH (0-23，整點)")
+    hour_str = parts[1]
+    if hour_str.endswith(":00"):
+        hour_str = hour_str[:-3]
+    # isdigit() 也接受 "²" 等 int() 無法轉換的字元，改用 isdecimal()
+    if not hour_str.isdecimal() or not 0 <= int(hour_str) <= 23:
+        return reply("時間格式不正確，請輸入 0-23 的整點，例如：設定提醒時間 7")
+    return Intent('set_send_hour', {'send_hour': int(hour_str)})
@@ -0,0 +1,311 @@
+"""Webhook (app.py) 與排程任務 (api/send_daily_job.py) 共用的輕量核心模組。
+
+包含冷啟動量測、日誌設定、LINE 與 Firebase 的延遲初始化、批次寫入 (WriteBatcher)、
+active_countdowns 索引與日期工具，以及訊息產生邏輯。不會載入 Flask 或 webhook 處理器，
+讓排程任務的冷啟動不需要建立整個 Flask app；只有 webhook 使用的計數器、快取與執行器放在 webhook_utils.py。
+"""
+import atexit
+import os
+import time
+import threading
+from contextlib import contextmanager
+from datetime import date, datetime, timedelta
+import json
+import logging
+import queue
+from logging.handlers import QueueHandler, QueueListener
+
+# --- 冷啟動量測 ---
+# 記錄各相依套件的匯入耗時 (秒)，於冷啟動時輸出，找出冷啟動延遲的來源
+_process_started = time.perf_counter()
+IMPORT_TIMINGS = {}
+
+@contextmanager
+def timed_import(name):
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        IMPORT_TIMINGS[name] = IMPORT_TIMINGS.get(name, 0.0) + time.perf_counter() - started
+
+def log_cold_start(entry_point):
+    # 在入口模組匯入完成後呼叫一次，輸出各套件匯入耗時的明細
+    breakdown = ", ".join(f"{name}={seconds * 1000:.1f}ms" for name, seconds in IMPORT_TIMINGS.items())
+    total = (time.perf_counter() - _process_started) * 1000
+    logger.info(f"Cold start of {entry_point}: {total:.1f}ms since core import ({breakdown})")
+
+with timed_import('pytz'):
+    import pytz
+
+with timed_import('linebot'):
+    from linebot.v3.messaging import ApiClient, Configuration, MessagingApi
+
+# --- 日誌設定 ---
+# 請求執行緒只把 LogRecord 放進佇列，實際的輸出 I/O 由背景的 QueueListener 執行，
+# 請求延遲不再包含寫入日誌的時間
+def setup_logging(level=logging.INFO):
+    root = logging.getLogger()
+    if root.handlers:
+        return None
+    log_queue = queue.SimpleQueue()
+    stream_handler = logging.StreamHandler()
+    stream_handler.setFormatter(logging.Formatter(logging.BASIC_FORMAT))
+    listener = QueueListener(log_queue, stream_handler, respect_handler_level=True)
+    root.addHandler(QueueHandler(log_queue))
+    root.setLevel(level)
+    listener.start()
+    # 結束前停止 listener，確保佇列中剩餘的日誌都已輸出
+    atexit.register(listener.stop)
+    return listener
+
+setup_logging()
+logger = logging.getLogger(__name__)
+
+# LINE API 連線池大小，決定同一個執行個體可同時保持多少條 keep-alive 連線
+LINE_POOL_SIZE = int(os.getenv('LINE_POOL_SIZE', '10'))
+
+configuration = Configuration(access_token=os.getenv('CHANNEL_ACCESS_TOKEN'))
+configuration.connection_pool_maxsize = LINE_POOL_SIZE
+
+# --- 共用的 LINE API client ---
+# 整個行程共用一個 ApiClient，讓 webhook 事件之間、以及溫執行個體上的請求之間都能重複使用
+# 已建立的 TLS 連線；urllib3 的連線池本身是執行緒安全的
+_api_client = None
+_messaging_api = None
+_api_lock = threading.Lock()
+
+def get_messaging_api():
+    """回傳共用的 MessagingApi，第一次呼叫時才建立 (執行緒安全)。"""
+    global _api_client, _messaging_api
+    if _messaging_api is None:
+        with _api_lock:
+            if _messaging_api is None:
+                _api_client = ApiClient(configuration)
+                _messaging_api = MessagingApi(_api_client)
+                atexit.register(close_messaging_api)
+    return _messaging_api
+
+def close_messaging_api():
+    # 關閉共用的 client 並釋放連線池中的所有連線，下次呼叫 get_messaging_api() 會重新建立
+    global _api_client, _messaging_api
+    with _api_lock:
+        if _api_client is not None:
+            _api_client.close()
+            _api_client.rest_client.pool_manager.clear()
+            _api_client = None
+            _messaging_api = None
+
+# --- Firebase 初始化 (延遲到第一次使用時) ---
+# 冷啟動時不解析金鑰也不建立 Firestore client，只有真正需要資料庫的請求才付出這個成本
+_db = None
+_db_initialized = False
+_db_lock = threading.Lock()
+
+def _init_firestore():
+    # webhook 的 firebase_admin 在這裡才匯入，冷啟動日誌已經輸出，匯入耗時改記在初始化日誌中
+    started = time.perf_counter()
+    with timed_import('firebase_admin'):
+        import firebase_admin
+        from firebase_admin import credentials, firestore
+    import_ms = (time.perf_counter() - started) * 1000
+    try:
+        service_account_json_str = os.getenv('FIREBASE_SERVICE_ACCOUNT_KEY_JSON')
+        if service_account_json_str:
+            service_account_info = json.loads(service_account_json_str)
+            cred = credentials.Certificate(service_account_info)
+        else:
+            raise ValueError("FIREBASE_SERVICE_ACCOUNT_KEY_JSON environment variable is not set.")
+        firebase_admin.initialize_app(cred)
+        client = firestore.client()
+        logger.info(f"Firebase app initialized and Firestore client created in {(time.perf_counter() - started) * 1000:.1f}ms (firebase_admin import {import_ms:.1f}ms).")
+        return client
+    except Exception as e:
+        logger.critical(f"FATAL ERROR: Could not initialize Firebase or Firestore: {e}")
+        return None
+
+def get_db():
+    """回傳共用的 Firestore client，第一次呼叫時才初始化 (執行緒安全)。
+
+    初始化失敗時回傳 None，且不會在之後的呼叫中重試，與原本匯入時初始化的行為相同。
+    """
+    global _db, _db_initialized
+    if not _db_initialized:
+        with _db_lock:
+            if not _db_initialized:
+                _db = _init_firestore()
+                _db_initialized = True
+    return _db
+
+# --- 批次寫入 ---
+class WriteBatcher:
+    """收集多筆 Firestore set() / delete()，以 WriteBatch 一次提交 (group commit)。
+
+    呼叫端在一段工作 (例如一包 webhook 事件) 結束時呼叫 flush()；
+    累積到 Firestore 單一批次的上限時會自動提交。
+    提交依序進行：flush() 回傳後，先前排入的寫入都已提交，之後的直接寫入不會被它們覆蓋。
+    """
+
+    MAX_WRITES = 500
+
+    def __init__(self, name, counters=None):
+        # counters (例如 webhook 的 metrics) 有提供時記錄提交次數與寫入筆數
+        self.name = name
+        self.counters = counters
+        self._lock = threading.Lock()
+        self._commit_lock = threading.Lock()
+        self._pending = []
+
+    def set(self, doc_ref, data, merge=False):
+        self._add((doc_ref, data, merge))
+
+    def delete(self, doc_ref):
+        self._add((doc_ref, None, False))
+
+    def _add(self, write):
+        with self._lock:
+            self._pending.append(write)
+            full = len(self._pending) >= self.MAX_WRITES
+        if full:
+            self.flush()
+
+    def flush(self, doc_id=None):
+        # 回傳成功提交的寫入筆數；指定 doc_id 時只提交該文件 ID 的寫入，其餘留待下次提交
+        with self._commit_lock:
+            with self._lock:
+                if doc_id is None:
+                    pending, self._pending = self._pending, []
+                else:
+                    pending = [w for w in self._pending if w[0].id == doc_id]
+                    self._pending = [w for w in self._pending if w[0].id != doc_id]
+            return self._commit(pending)
+
+    def _commit(self, pending):
+        # 只計算成功提交的寫入；失敗的批次寫入日誌 (有 counters 時另記在 {name}_failed_writes)
+        committed = 0
+        for start in range(0, len(pending), self.MAX_WRITES):
+            chunk = pending[start:start + self.MAX_WRITES]
+            batch = get_db().batch()
+            for doc_ref, data, merge in chunk:
+                if data is None:
+                    batch.delete(doc_ref)
+                else:
+                    batch.set(doc_ref, data, merge=merge)
+            try:
+                batch.commit()
+            except Exception as e:
+                if self.counters is not None:
+                    self.counters.incr(f'{self.name}_failed_writes', len(chunk))
+                logger.error(f"Failed to commit {self.name} batch with {len(chunk)} writes: {e}")
+                continue
+            if self.counters is not None:
+                self.counters.incr(f'{self.name}_commits')
+                self.counters.incr(f'{self.name}_writes', len(chunk))
+                self.counters.record_max(f'{self.name}_max_writes_per_commit', len(chunk))
+            logger.info(f"Committed {self.name} batch with {len(chunk)} writes.")
+            committed += len(chunk)
+        return committed
+
+# --- active_countdowns 索引 ---
+# 每個「還在倒數」的聊天室在 active_countdowns 有一筆精簡的索引文件 (文件 ID 即聊天室 ID)，
+# 只包含 exam_day、send_hour 與排程用的 last_sent_day；排程任務只讀這個集合，
+# 不必掃描包含所有好友與群組的 chats 集合
+ACTIVE_COUNTDOWNS = 'active_countdowns'
+
+# 考試結束後仍繼續發送「考試已經結束」訊息的天數；超過後聊天室會被封存並從索引移除
+ARCHIVE_GRACE_DAYS = int(os.getenv('ARCHIVE_GRACE_DAYS', '3'))
+
+def active_countdown_ref(db, chat_id):
+    return db.collection(ACTIVE_COUNTDOWNS).document(chat_id)
+
+def countdown_cutoff(today):
+    # exam_day 不小於這個日序數的聊天室仍算「還在倒數」(含考試結束後的寬限期)
+    return today.toordinal() - ARCHIVE_GRACE_DAYS
+
+# --- 日期工具 ---
+# 每日提醒的預設發送時間 (台北時間整點)，與原本 UTC 23:00 的排程相同
+DEFAULT_SEND_HOUR = 7
+
+def taipei_now():
+    # 取得台北時區的現在時間
+    return datetime.now(pytz.timezone("Asia/Taipei"))
+
+def taipei_today():
+    # 以台北時區取得今天的日期
+    return taipei_now().date()
+
+def exam_date_from_day(exam_day):
+    # exam_day_from_str() 的反向轉換
+    return date.fromordinal(exam_day).isoformat()
+
+def exam_day_from_str(exam_date_str):
+    # 將 YYYY-MM-DD 字串轉成日序數 (date.toordinal())，格式錯誤時拋出 ValueError
+    return datetime.strptime(exam_date_str, "%Y-%m-%d").date().toordinal()
+
+# --- 訊息生成函數 ---
+def render_countdown_message(exam_date_str, exam_day, today_ordinal):
+    # 依指定的「今天」(日序數) 產生倒數訊息，不含任何快取
+    if not exam_date_str:
+        return "很抱歉，尚未設定考試日期。請輸入'設定考試日期 YYYY-MM-DD'來設定。"
+    try:
+        # 1. 取得考試日的日序數；Firestore 中已存有 exam_day 時就不必再解析字串
+        if exam_day is None:
+            exam_day = exam_day_from_str(exam_date_str)
+
+        # 2. 以台北時區的今天計算剩餘天數，日序數相減即為天數差
+        days_left = exam_day - today_ordinal
+        
+        if days_left > 0:
+            message = ""
+            if days_left == 100: message = f"⌛時光飛逝，你只剩下{days_left} 天，趕快拿起書本來📚📚"
+            elif days_left == 90: message = f"沒想到已經剩下{days_left} 天\n｡ﾟヽ(ﾟ´Д`)ﾉﾟ｡時間都在我的睡夢中流失了！"
+            elif days_left == 30: message = f"距離考試只剩下 {days_left} 天！\n祝你考試像打遊戲一樣，一路都是暴擊，分數直接爆表！🔥🔥"
+            elif days_left == 10: message = f"距離考試只剩下 {days_left} 天！\n祝你考試像吃雞腿一樣，輕鬆又美味，分數高高🍗"
+            else: message = f"你今天讀書了嗎？💥\n距離考試只剩下 {days_left} 天！加油！💪💪💪"
+        elif days_left == 0: message = f"你今天讀書了嗎？\n今天是考試的日子🏆金榜題名🏆"
+        else: message = f"考試 ({exam_date_str}) 已經在 {abs(days_left)} 天前結束了。期待你下次的挑戰！"
+        return message
+    except ValueError:
+        return "考試日期格式錯誤，請檢查設定或重新設定。正確格式為YYYY-MM-DD。"
+
+class CountdownRenderer:
+    """以固定的「今天」產生倒數訊息，並依考試日期快取訊息內容。
+
+    排程任務每次執行建立一個，渲染次數只與不同考試日期的數量有關，而不是聊天室數量。
+    """
+
+    def __init__(self, today=None):
+        self.today = today or taipei_today()
+        self._today_ordinal = self.today.toordinal()
+        self._messages = {}
+
+    def render(self, exam_date_str, exam_day=None):
+        message = self._messages.get(exam_date_str)
+        if message is None:
+            message = render_countdown_message(exam_date_str, exam_day, self._today_ordinal)
+            self._messages[exam_date_str] = message
+        return message
+
+    def render_day(self, exam_day):
+        # 只有日序數時使用 (例如 active_countdowns 索引)，快取未命中時才還原日期字串
+        message = self._messages.get(exam_day)
+        if message is None:
+            message = render_countdown_message(exam_date_from_day(exam_day), exam_day, self._today_ordinal)
+            self._messages[exam_day] = message
+        return message
+
+# Webhook 共用的 renderer，於台北時間午夜失效並重新建立
+_renderer = None
+_renderer_expires_at = 0.0
+
+def current_renderer():
+    global _renderer, _renderer_expires_at
+    if _renderer is None or time.time() >= _renderer_expires_at:
+        renderer = CountdownRenderer()
+        tomorrow = datetime.combine(renderer.today + timedelta(days=1), datetime.min.time())
+        # 先換上新的 renderer 再更新到期時間，其他執行緒不會拿到過期的 renderer
+        _renderer = renderer
+        _renderer_expires_at = pytz.timezone("Asia/Taipei").localize(tomorrow).timestamp()
+    return _renderer
+
+def get_countdown_message(exam_date_str, exam_day=None):
+    return current_renderer().render(exam_date_str, exam_day)
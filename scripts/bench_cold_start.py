@@ -0,0 +1,48 @@
+"""量測匯入入口模組的冷啟動時間與記憶體用量。
+
+每次都在新的子行程中匯入模組，回報匯入耗時與最大常駐記憶體 (RSS)。
+可在拆分前後的版本各執行一次來比較，例如：
+
+    python scripts/bench_cold_start.py api.send_daily_job app --runs 5
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+PROBE = """
+import json, resource, sys, time
+started = time.perf_counter()
+import importlib
+importlib.import_module(sys.argv[1])
+elapsed = time.perf_counter() - started
+rss_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+print(json.dumps({"seconds": elapsed, "rss_kb": rss_kb, "modules": len(sys.modules)}))
+"""
+
+def measure(module, runs):
+    samples = []
+    for _ in range(runs):
+        output = subprocess.run(
+            [sys.executable, "-c", PROBE, module],
+            cwd=ROOT, check=True, capture_output=True, text=True,
+        ).stdout
+        samples.append(json.loads(output.strip().splitlines()[-1]))
+    return {
+        "module": module,
+        "median_ms": round(statistics.median(s["seconds"] for s in samples) * 1000, 1),
+        "max_rss_mb": round(max(s["rss_kb"] for s in samples) / 1024, 1),
+        "modules_loaded": samples[-1]["modules"],
+    }
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Measure cold-start import time and RSS of entry points.")
+    parser.add_argument('modules', nargs='*', default=['api.send_daily_job', 'app'])
+    parser.add_argument('--runs', type=int, default=5)
+    args = parser.parse_args()
+    for module in args.modules:
+        print(json.dumps(measure(module, args.runs), ensure_ascii=False))
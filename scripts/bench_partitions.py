@@ -0,0 +1,114 @@
+"""以本機的假 Firestore 量測分區並行讀取的加速效果。
+
+假資料庫每次查詢固定延遲 --latency-ms，另外每筆文件再加 --per-doc-us 微秒，
+發送端每頁固定花費 --send-ms 模擬 LINE API 呼叫。針對每個區段數跑一次完整的讀取與發送管線，
+回報總耗時與相對於單一區段的加速倍數，例如：
+
+    python scripts/bench_partitions.py --chats 200000 --partitions 1 2 4 8
+"""
+import argparse
+import bisect
+import json
+import os
+import random
+import sys
+import threading
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from api.send_daily_job import PageReader, partition_ranges
+
+class FakeDoc:
+    def __init__(self, doc_id, data):
+        self.id = doc_id
+        self._data = data
+
+    def get(self, field):
+        return self._data.get(field)
+
+def sort_key(doc):
+    return (doc.get('send_hour'), doc.get('exam_day'), doc.get('last_sent_day'), doc.id)
+
+def make_docs(chats, group_ratio, seed):
+    rng = random.Random(seed)
+    docs = []
+    for _ in range(chats):
+        prefix = 'C' if rng.random() < group_ratio else 'U'
+        doc_id = prefix + format(rng.getrandbits(128), '032x')
+        docs.append(FakeDoc(doc_id, {'send_hour': 7, 'exam_day': 739000 + rng.randrange(365), 'last_sent_day': 0}))
+    # 與 fetch_page 相同的排序 (send_hour, exam_day, last_sent_day, 文件 ID)
+    docs.sort(key=sort_key)
+    return docs
+
+def fake_fetch(docs, latency, per_doc):
+    # 依 id_range 預先篩選並建立排序鍵，查詢本身只做二分搜尋，耗時由模擬的延遲主導
+    by_range = {}
+    lock = threading.Lock()
+
+    def fetch(cursor, page_size, id_range):
+        with lock:
+            if id_range not in by_range:
+                start_id, end_id = id_range
+                matched = [
+                    d for d in docs
+                    if (start_id is None or d.id >= start_id) and (end_id is None or d.id < end_id)
+                ]
+                by_range[id_range] = (matched, [sort_key(d) for d in matched])
+            matched, keys = by_range[id_range]
+        start = 0
+        if cursor is not None:
+            start = bisect.bisect_right(keys, (cursor['send_hour'], cursor['exam_day'], cursor['last_sent_day'], cursor['doc_id']))
+        page = matched[start:start + page_size]
+        time.sleep(latency + per_doc * len(page))
+        return page
+    return fetch
+
+def run(docs, partitions, args):
+    fetch = fake_fetch(docs, args.latency_ms / 1000, args.per_doc_us / 1e6)
+    reader = PageReader(fetch, partition_ranges(partitions), [None] * partitions, args.page_size, args.prefetch)
+    started = time.monotonic()
+    reader.start()
+    seen = 0
+    try:
+        while True:
+            page = reader.next_page(timeout=None)
+            if page is None:
+                break
+            _, page_docs = page
+            if page_docs:
+                time.sleep(args.send_ms / 1000)
+                seen += len(page_docs)
+    finally:
+        reader.close()
+    elapsed = time.monotonic() - started
+    if seen != len(docs):
+        raise SystemExit(f"partitions={partitions}: read {seen} chats, expected {len(docs)}")
+    return elapsed
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark partitioned page reads against a local fake Firestore.")
+    parser.add_argument('--chats', type=int, default=20000)
+    parser.add_argument('--group-ratio', type=float, default=0.05)
+    parser.add_argument('--page-size', type=int, default=500)
+    parser.add_argument('--prefetch', type=int, default=2)
+    parser.add_argument('--partitions', type=int, nargs='+', default=[1, 2, 4, 8])
+    parser.add_argument('--latency-ms', type=float, default=80)
+    parser.add_argument('--per-doc-us', type=float, default=100)
+    parser.add_argument('--send-ms', type=float, default=20)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    docs = make_docs(args.chats, args.group_ratio, args.seed)
+    baseline = None
+    for partitions in args.partitions:
+        elapsed = run(docs, partitions, args)
+        if baseline is None:
+            baseline = elapsed
+        print(json.dumps({
+            "partitions": partitions,
+            "seconds": round(elapsed, 3),
+            "chats_per_second": round(len(docs) / elapsed, 1),
+            "speedup": round(baseline / elapsed, 2),
+        }))
@@ -0,0 +1,99 @@
+"""為既有的 chats 文件補上 exam_day 欄位 (考試日的日序數) 與 send_hour 欄位，
+並為還在倒數的聊天室建立 active_countdowns 索引 (排程任務只讀取這個索引)。
+
+請避開排程發送的時段執行：重建的索引項目 last_sent_day 為 0，同一時段重跑排程會再發送一次。
+
+以文件 ID 排序分頁讀取，每頁以一個 WriteBatch 寫回，並在每頁完成後
+將進度 (最後處理的文件 ID) 寫入 migrations/exam_day，中斷後重新執行
+即可從上次停下的位置繼續。
+
+用法：
+    python scripts/migrate_exam_day.py [--page-size 250] [--restart] [--dry-run]
+"""
+import argparse
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from google.cloud.firestore_v1.field_path import FieldPath
+
+from core import DEFAULT_SEND_HOUR, active_countdown_ref, get_db, exam_day_from_str, logger, taipei_today, countdown_cutoff
+
+PROGRESS_DOC = ('migrations', 'exam_day')
+
+def migrate(db, page_size, restart=False, dry_run=False):
+    chats_ref = db.collection('chats')
+    progress_ref = db.collection(PROGRESS_DOC[0]).document(PROGRESS_DOC[1])
+
+    last_doc_id = None
+    if not restart:
+        progress = progress_ref.get()
+        if progress.exists:
+            last_doc_id = progress.to_dict().get('last_doc_id')
+            if progress.to_dict().get('done'):
+                logger.info("Migration already completed. Use --restart to run it again.")
+                return
+    if last_doc_id:
+        logger.info(f"Resuming migration after document: {last_doc_id}")
+
+    cutoff = countdown_cutoff(taipei_today())
+    scanned = updated = indexed = invalid = 0
+    while True:
+        query = chats_ref.order_by(FieldPath.document_id()).limit(page_size)
+        if last_doc_id:
+            query = query.start_after({FieldPath.document_id(): chats_ref.document(last_doc_id)})
+        docs = list(query.select(['exam_date', 'exam_day', 'send_hour']).stream())
+        if not docs:
+            break
+
+        batch = db.batch()
+        batch_size = 0
+        for doc in docs:
+            scanned += 1
+            chat_data = doc.to_dict() or {}
+            exam_date_str = chat_data.get('exam_date')
+            if not exam_date_str:
+                continue
+            try:
+                exam_day = exam_day_from_str(exam_date_str)
+            except ValueError:
+                invalid += 1
+                logger.warning(f"Skipping chat {doc.id} with malformed exam_date: {exam_date_str}")
+                continue
+            updates = {}
+            if chat_data.get('exam_day') != exam_day:
+                updates['exam_day'] = exam_day
+            send_hour = chat_data.get('send_hour')
+            if send_hour is None:
+                send_hour = updates['send_hour'] = DEFAULT_SEND_HOUR
+            if updates:
+                batch.update(doc.reference, updates)
+                batch_size += 1
+            if exam_day >= cutoff:
+                batch.set(active_countdown_ref(db, doc.id), {'exam_day': exam_day, 'send_hour': send_hour, 'last_sent_day': 0})
+                batch_size += 1
+                indexed += 1
+
+        last_doc_id = docs[-1].id
+        if not dry_run:
+            if batch_size:
+                batch.commit()
+            progress_ref.set({'last_doc_id': last_doc_id, 'done': False}, merge=True)
+        updated += batch_size
+        logger.info(f"Migrated page ending at {last_doc_id}: {batch_size} writes (scanned {scanned}).")
+
+    if not dry_run:
+        progress_ref.set({'last_doc_id': last_doc_id, 'done': True}, merge=True)
+    logger.info(f"Migration finished: scanned={scanned} writes={updated} indexed={indexed} invalid={invalid} dry_run={dry_run}")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Backfill chats.exam_day / chats.send_hour and build the active_countdowns index.")
+    parser.add_argument('--page-size', type=int, default=250, help="documents per page (max 250, each may need two writes in one WriteBatch)")
+    parser.add_argument('--restart', action='store_true', help="ignore saved progress and start from the beginning")
+    parser.add_argument('--dry-run', action='store_true', help="scan and report without writing")
+    args = parser.parse_args()
+    db = get_db()
+    if db is None:
+        sys.exit("Firestore client not available.")
+    migrate(db, min(args.page_size, 250), restart=args.restart, dry_run=args.dry_run)
@@ -0,0 +1,64 @@
+import os
+import sys
+from datetime import date, datetime
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+os.environ.setdefault('CHANNEL_SECRET', 'test-channel-secret')
+
+import core
+from fake_firestore import FakeFirestore
+
+class FakeMessagingApi:
+    """記錄每次呼叫的收件者；fail_for 中的收件者會讓該次呼叫失敗。"""
+
+    def __init__(self):
+        self.multicasts = []
+        self.pushes = []
+        self.replies = []
+        self.fail_for = set()
+
+    def _check(self, recipients):
+        if self.fail_for.intersection(recipients):
+            raise RuntimeError("LINE API error")
+
+    def multicast(self, request):
+        self._check(request.to)
+        self.multicasts.append((list(request.to), request.messages[0].text))
+
+    def push_message(self, request):
+        self._check([request.to])
+        self.pushes.append((request.to, request.messages[0].text))
+
+    def reply_message_with_http_info(self, request):
+        self.replies.append([getattr(m, 'text', None) for m in request.messages])
+
+    def sent_to(self):
+        return sorted([chat_id for recipients, _ in self.multicasts for chat_id in recipients] + [chat_id for chat_id, _ in self.pushes])
+
+@pytest.fixture
+def db(monkeypatch):
+    fake = FakeFirestore()
+    monkeypatch.setattr(core, 'get_db', lambda: fake)
+    return fake
+
+@pytest.fixture
+def line_api():
+    return FakeMessagingApi()
+
+# 排程測試使用的固定「今天」(台北時間)
+TODAY = date(2026, 10, 16)
+
+@pytest.fixture
+def run_job(db, line_api, monkeypatch):
+    from api import send_daily_job as job
+    monkeypatch.setattr(job, 'get_db', lambda: db)
+    monkeypatch.setattr(job, 'get_messaging_api', lambda: line_api)
+
+    def run(hour=7, **kwargs):
+        monkeypatch.setattr(job, 'taipei_now', lambda: datetime(TODAY.year, TODAY.month, TODAY.day, hour, 0))
+        return job.execute_job(hour=hour, **kwargs)
+    return run
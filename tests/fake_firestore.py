@@ -0,0 +1,292 @@
+"""測試用的記憶體內 Firestore client。
+
+只實作本專案用到的 API：collection / document、where(filter=FieldFilter)、order_by、
+select、limit、start_after、stream、batch、get_all、write_option (last_update_time 前置條件)
+與 transaction (可搭配 firestore.transactional，讀取過的文件在提交前被修改時以 Aborted 重試)。
+查詢會排除缺少篩選或排序欄位的文件，與 Firestore 的行為相同。
+"""
+import itertools
+import threading
+
+from google.api_core.exceptions import Aborted, AlreadyExists, FailedPrecondition, NotFound
+
+DOCUMENT_ID = '__name__'
+
+class FakeSnapshot:
+    def __init__(self, reference, data, update_time):
+        self.reference = reference
+        self.id = reference.id
+        self._data = data
+        self.update_time = update_time
+
+    @property
+    def exists(self):
+        return self._data is not None
+
+    def to_dict(self):
+        return None if self._data is None else dict(self._data)
+
+    def get(self, field_path):
+        # 與 DocumentSnapshot.get 相同，欄位不存在時拋出 KeyError
+        if self._data is None or field_path not in self._data:
+            raise KeyError(field_path)
+        return self._data[field_path]
+
+class FakeDocumentReference:
+    def __init__(self, client, collection_id, doc_id):
+        self._client = client
+        self.collection_id = collection_id
+        self.id = doc_id
+        self.path = f"{collection_id}/{doc_id}"
+
+    def get(self, field_paths=None, transaction=None):
+        snapshot = self._client._snapshot(self)
+        if transaction is not None:
+            transaction._reads[self.path] = snapshot.update_time
+        if field_paths is not None and snapshot.exists:
+            data = {k: v for k, v in snapshot.to_dict().items() if k in field_paths}
+            snapshot = FakeSnapshot(self, data, snapshot.update_time)
+        return snapshot
+
+    def set(self, data, merge=False):
+        self._client._commit([('set', self, data, merge, None)])
+
+    def update(self, data):
+        self._client._commit([('update', self, data, False, None)])
+
+    def delete(self, option=None):
+        self._client._commit([('delete', self, None, False, option)])
+
+    def create(self, data):
+        self._client._commit([('create', self, data, False, None)])
+
+class FakeQuery:
+    def __init__(self, client, collection_id, filters=(), orders=(), limit=None, start_after=None, projection=None):
+        self._client = client
+        self._collection_id = collection_id
+        self._filters = tuple(filters)
+        self._orders = tuple(orders)
+        self._limit = limit
+        self._start_after = start_after
+        self._projection = projection
+
+    def _copy(self, **changes):
+        params = dict(
+            filters=self._filters, orders=self._orders, limit=self._limit,
+            start_after=self._start_after, projection=self._projection,
+        )
+        params.update(changes)
+        return FakeQuery(self._client, self._collection_id, **params)
+
+    def where(self, filter):
+        return self._copy(filters=self._filters + ((filter.field_path, filter.op_string, filter.value),))
+
+    def order_by(self, field_path):
+        return self._copy(orders=self._orders + (field_path,))
+
+    def select(self, field_paths):
+        return self._copy(projection=tuple(field_paths))
+
+    def limit(self, count):
+        return self._copy(limit=count)
+
+    def start_after(self, values):
+        return self._copy(start_after=values)
+
+    def _sort_fields(self):
+        orders = list(self._orders)
+        # Firestore 會把不等式欄位補在排序後面，最後以文件 ID 排序
+        for field, op, _ in self._filters:
+            if op != '==' and field not in orders:
+                orders.append(field)
+        if DOCUMENT_ID not in orders:
+            orders.append(DOCUMENT_ID)
+        return orders
+
+    def stream(self):
+        sort_fields = self._sort_fields()
+        rows = []
+        for reference, data, update_time in self._client._documents(self._collection_id):
+            if all(_matches(reference, data, *f) for f in self._filters) and all(
+                field == DOCUMENT_ID or field in data for field in sort_fields
+            ):
+                rows.append((tuple(_value(reference, data, field) for field in sort_fields), reference, data, update_time))
+        rows.sort(key=lambda row: row[0])
+        if self._start_after is not None:
+            after = tuple(_comparable(self._start_after[field]) for field in sort_fields)
+            rows = [row for row in rows if row[0] > after]
+        if self._limit is not None:
+            rows = rows[:self._limit]
+        for _, reference, data, update_time in rows:
+            if self._projection is not None:
+                data = {k: v for k, v in data.items() if k in self._projection}
+            yield FakeSnapshot(reference, dict(data), update_time)
+
+    def get(self):
+        return list(self.stream())
+
+class FakeCollection(FakeQuery):
+    def __init__(self, client, collection_id):
+        super().__init__(client, collection_id)
+        self.id = collection_id
+
+    def document(self, doc_id):
+        return FakeDocumentReference(self._client, self.id, doc_id)
+
+class FakeWriteOption:
+    def __init__(self, last_update_time=None, exists=None):
+        self.last_update_time = last_update_time
+        self.exists = exists
+
+class FakeWriteBatch:
+    def __init__(self, client):
+        self._client = client
+        self._writes = []
+
+    def set(self, reference, data, merge=False):
+        self._writes.append(('set', reference, data, merge, None))
+
+    def update(self, reference, data, option=None):
+        self._writes.append(('update', reference, data, False, option))
+
+    def delete(self, reference, option=None):
+        self._writes.append(('delete', reference, None, False, option))
+
+    def commit(self):
+        self._client._commit(self._writes)
+        self._writes = []
+
+class FakeTransaction(FakeWriteBatch):
+    """提供 firestore.transactional 需要的 _begin / _commit / _rollback 等介面。"""
+
+    _max_attempts = 5
+    _read_only = False
+
+    def __init__(self, client):
+        super().__init__(client)
+        self._id = None
+        self._reads = {}
+
+    def _clean_up(self):
+        self._writes = []
+        self._reads = {}
+        self._id = None
+
+    def _begin(self, retry_id=None):
+        self._id = b'fake-transaction'
+
+    def _rollback(self):
+        self._clean_up()
+
+    def _commit(self):
+        try:
+            self._client._commit(self._writes, expected=self._reads)
+        finally:
+            self._clean_up()
+        return []
+
+class FakeFirestore:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._store = {}
+        self._clock = itertools.count(1)
+        self.commits = []
+
+    def collection(self, collection_id):
+        return FakeCollection(self, collection_id)
+
+    def batch(self):
+        return FakeWriteBatch(self)
+
+    def transaction(self):
+        return FakeTransaction(self)
+
+    def write_option(self, last_update_time=None, exists=None):
+        return FakeWriteOption(last_update_time, exists)
+
+    def get_all(self, references, field_paths=None):
+        return [reference.get(field_paths=field_paths) for reference in references]
+
+    # --- 測試輔助 ---
+    def seed(self, collection_id, doc_id, data):
+        self.collection(collection_id).document(doc_id).set(data)
+
+    def data(self, collection_id, doc_id):
+        return self._snapshot(self.collection(collection_id).document(doc_id)).to_dict()
+
+    def ids(self, collection_id):
+        return sorted(reference.id for reference, _, _ in self._documents(collection_id))
+
+    # --- 內部實作 ---
+    def _snapshot(self, reference):
+        with self._lock:
+            entry = self._store.get(reference.path)
+        if entry is None:
+            return FakeSnapshot(reference, None, None)
+        data, update_time = entry
+        return FakeSnapshot(reference, dict(data), update_time)
+
+    def _documents(self, collection_id):
+        prefix = collection_id + '/'
+        with self._lock:
+            items = [(path, entry) for path, entry in self._store.items() if path.startswith(prefix) and '/' not in path[len(prefix):]]
+        return [(self.collection(collection_id).document(path[len(prefix):]), dict(data), update_time) for path, (data, update_time) in items]
+
+    def _commit(self, writes, expected=None):
+        # 所有前置條件都成立才套用全部寫入，與 WriteBatch 的原子性相同；
+        # expected 為 transaction 讀取過的文件版本，任一文件已被修改時拋出 Aborted
+        with self._lock:
+            for path, update_time in (expected or {}).items():
+                entry = self._store.get(path)
+                if (entry[1] if entry is not None else None) != update_time:
+                    raise Aborted(f"{path} was modified during the transaction")
+            for kind, reference, _, _, option in writes:
+                entry = self._store.get(reference.path)
+                if kind == 'create' and entry is not None:
+                    raise AlreadyExists(f"{reference.path} already exists")
+                if kind == 'update' and entry is None:
+                    raise NotFound(f"{reference.path} not found")
+                if option is not None and option.last_update_time is not None:
+                    if entry is None or entry[1] != option.last_update_time:
+                        raise FailedPrecondition(f"{reference.path} was modified")
+            update_time = next(self._clock)
+            for kind, reference, data, merge, _ in writes:
+                if kind == 'delete':
+                    self._store.pop(reference.path, None)
+                    continue
+                current = self._store.get(reference.path)
+                if kind == 'update' or (kind == 'set' and merge and current is not None):
+                    new_data = dict(current[0])
+                    new_data.update(data)
+                else:
+                    new_data = dict(data)
+                self._store[reference.path] = (new_data, update_time)
+            self.commits.append(len(writes))
+
+def _value(reference, data, field):
+    if field == DOCUMENT_ID:
+        return reference.id
+    return data[field]
+
+def _comparable(value):
+    # 文件 ID 的游標與篩選值是 DocumentReference，以 ID 比較
+    return getattr(value, 'id', value)
+
+def _matches(reference, data, field, op, value):
+    if field != DOCUMENT_ID and field not in data:
+        return False
+    actual = _value(reference, data, field)
+    value = _comparable(value)
+    if op == '==':
+        return actual == value
+    if op == '<':
+        return actual < value
+    if op == '<=':
+        return actual <= value
+    if op == '>':
+        return actual > value
+    if op == '>=':
+        return actual >= value
+    if op == 'in':
+        return actual in value
+    raise NotImplementedError(op)
@@ -0,0 +1,74 @@
+import base64
+import hashlib
+import hmac
+import json
+import os
+
+import pytest
+
+import app
+from core import ACTIVE_COUNTDOWNS
+
+USER_ID = 'U' + 'a' * 32
+
+@pytest.fixture
+def webhook(db, line_api, monkeypatch):
+    monkeypatch.setattr(app, 'get_db', lambda: db)
+    monkeypatch.setattr(app, 'get_messaging_api', lambda: line_api)
+    app.exam_date_cache._data.clear()
+    app.seen_events._data.clear()
+
+    def post(*events):
+        body = json.dumps({'destination': 'Ubot', 'events': list(events)})
+        secret = os.environ['CHANNEL_SECRET'].encode('utf-8')
+        signature = base64.b64encode(hmac.new(secret, body.encode('utf-8'), hashlib.sha256).digest()).decode('utf-8')
+        payload = app.line_handler.parser.parse(body, signature, as_payload=True)
+        app.process_events(payload.events)
+    return post
+
+def event(n, kind, **fields):
+    data = {
+        'type': kind,
+        'timestamp': 1700000000000 + n,
+        'source': {'type': 'user', 'userId': USER_ID},
+        'replyToken': f'reply-{n}',
+        'mode': 'active',
+        'webhookEventId': f'event-{n}',
+        'deliveryContext': {'isRedelivery': False},
+    }
+    data.update(fields)
+    return data
+
+def text(n, message):
+    return event(n, 'message', message={'type': 'text', 'id': str(n), 'text': message, 'quoteToken': 'q'})
+
+def test_set_exam_date_after_follow_in_same_payload_is_kept(db, webhook):
+    webhook(event(1, 'follow'), text(2, '設定考試日期 2027-01-10'))
+
+    chat = db.data('chats', USER_ID)
+    assert chat['exam_date'] == '2027-01-10'
+    assert chat['type'] == 'user'
+    assert db.data(ACTIVE_COUNTDOWNS, USER_ID)['exam_day'] == chat['exam_day']
+    assert app.get_exam_date(USER_ID) == ('2027-01-10', chat['exam_day'])
+
+def test_follow_after_set_exam_date_resets_the_chat(db, webhook):
+    webhook(text(1, '設定考試日期 2027-01-10'), event(2, 'follow'))
+
+    assert db.data('chats', USER_ID)['exam_date'] is None
+    assert db.data(ACTIVE_COUNTDOWNS, USER_ID) is None
+
+def test_set_exam_date_after_archive_keeps_send_hour(db, webhook):
+    db.seed('archived_chats', USER_ID, {'type': 'user', 'exam_date': '2026-01-10', 'send_hour': 21})
+    webhook(event(1, 'follow'), text(2, '設定考試日期 2027-01-10'))
+
+    assert db.data('chats', USER_ID)['send_hour'] == 21
+    assert db.data(ACTIVE_COUNTDOWNS, USER_ID)['send_hour'] == 21
+
+def test_setting_the_date_again_after_todays_send_does_not_push_twice(db, webhook, line_api, run_job):
+    webhook(text(1, '設定考試日期 2027-01-10'))
+    assert run_job(hour=7)["completed"]
+    webhook(text(2, '設定考試日期 2027-01-10'), text(3, '設定考試日期 2027-02-01'))
+    assert run_job(hour=9)["completed"]
+
+    assert line_api.sent_to() == [USER_ID]
+    assert db.data(ACTIVE_COUNTDOWNS, USER_ID)['exam_day'] == db.data('chats', USER_ID)['exam_day']
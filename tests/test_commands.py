@@ -0,0 +1,13 @@
+import pytest
+
+from commands import router
+
+@pytest.mark.parametrize('text, hour', [('設定提醒時間 7', 7), ('設定提醒時間 07', 7), ('設定提醒時間 07:00', 7), ('設定提醒時間 23', 23)])
+def test_set_send_hour_accepts_whole_hours(text, hour):
+    assert router.parse(text) == ('set_send_hour', {'send_hour': hour})
+
+@pytest.mark.parametrize('text', ['設定提醒時間 ²', '設定提醒時間 24', '設定提醒時間 7:30', '設定提醒時間 -1'])
+def test_set_send_hour_rejects_invalid_hours_with_hint(text):
+    intent = router.parse(text)
+    assert intent.name == 'reply'
+    assert '設定提醒時間' in intent.args['text']
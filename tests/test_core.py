@@ -0,0 +1,26 @@
+from core import WriteBatcher
+from webhook_utils import Counters
+
+def test_write_batcher_counts_only_committed_writes(db, monkeypatch):
+    counters = Counters()
+    writes = WriteBatcher('test_writes', counters)
+    writes.set(db.collection('chats').document('U1'), {'type': 'user'})
+    writes.set(db.collection('chats').document('U2'), {'type': 'user'})
+    assert writes.flush() == 2
+
+    def failing_commit(_writes):
+        raise RuntimeError("commit failed")
+    monkeypatch.setattr(db, '_commit', failing_commit)
+    writes.set(db.collection('chats').document('U3'), {'type': 'user'})
+    assert writes.flush() == 0
+    assert counters.snapshot() == {'test_writes_commits': 1, 'test_writes_writes': 2, 'test_writes_max_writes_per_commit': 2, 'test_writes_failed_writes': 1}
+
+def test_write_batcher_flushes_a_single_document(db):
+    writes = WriteBatcher('test_writes')
+    writes.set(db.collection('chats').document('U1'), {'type': 'user'})
+    writes.delete(db.collection('active_countdowns').document('U1'))
+    writes.set(db.collection('chats').document('U2'), {'type': 'user'})
+    assert writes.flush('U1') == 2
+    assert db.ids('chats') == ['U1']
+    assert writes.flush() == 1
+    assert db.ids('chats') == ['U1', 'U2']
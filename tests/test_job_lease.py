@@ -0,0 +1,97 @@
+import io
+import json
+import time
+
+from api import send_daily_job as job
+from api.send_daily_job import JobLease
+from conftest import TODAY
+from core import ACTIVE_COUNTDOWNS
+
+def test_runs_for_different_hours_share_the_lease(db):
+    first = JobLease(db, 0, 1, 8)
+    assert first.acquire() == (True, None)
+    try:
+        acquired, current = JobLease(db, 0, 1, 7).acquire()
+        assert not acquired
+        assert (current['shard'], current['of'], current['hour']) == (0, 1, 8)
+    finally:
+        first.release()
+    second = JobLease(db, 0, 1, 7)
+    assert second.acquire()[0]
+    second.release()
+
+def test_only_non_overlapping_shards_run_together(db):
+    leases = [JobLease(db, 0, 2, 7), JobLease(db, 1, 2, 7)]
+    try:
+        assert all(lease.acquire()[0] for lease in leases)
+        assert not JobLease(db, 0, 3, 7).acquire()[0]
+        assert not JobLease(db, 1, 2, 8).acquire()[0]
+    finally:
+        for lease in leases:
+            lease.release()
+    assert db.data('job_leases', 'daily') == {'holders': {}}
+
+def test_acquire_records_holder_and_release_clears_it(db):
+    lease = JobLease(db, 0, 1, 7)
+    assert lease.acquire() == (True, None)
+    holders = db.data('job_leases', 'daily')['holders']
+    assert holders[lease.holder]['hour'] == 7
+    assert not lease.is_lost()
+    lease.release()
+    assert db.data('job_leases', 'daily')['holders'] == {}
+
+def test_expired_holder_is_taken_over(db):
+    db.seed('job_leases', 'daily', {'holders': {'crashed': {'shard': 0, 'of': 1, 'hour': 7, 'expires_at': time.time() - 1}}})
+    lease = JobLease(db, 0, 1, 8)
+    assert lease.acquire() == (True, None)
+    assert list(db.data('job_leases', 'daily')['holders']) == [lease.holder]
+    lease.release()
+
+def test_busy_run_returns_409_with_holder_progress(db, monkeypatch):
+    monkeypatch.delenv('CRON_SECRET', raising=False)
+    monkeypatch.setattr(job, 'get_db', lambda: db)
+    running = JobLease(db, 0, 1, 7)
+    running.acquire()
+    try:
+        # 續約時寫入目前的進度
+        job._renew_lease(db.transaction(), running.ref, running.holder, running.lease_seconds, {'pages': 3})
+        status, body = call_handler('/api/send_daily_job?hour=8')
+    finally:
+        running.release()
+    assert status == 409
+    assert body['status'] == 'busy'
+    assert body['progress'] == {'pages': 3}
+    assert body['holder'] == {'shard': 0, 'of': 1, 'hour': 7}
+    assert body['expires_in_seconds'] > 0
+
+def test_job_stops_sending_after_the_lease_is_lost(db, line_api, run_job):
+    for n in range(1, 4):
+        db.seed(ACTIVE_COUNTDOWNS, f'U{n:032x}', {'exam_day': TODAY.toordinal() + 10, 'send_hour': 7, 'last_sent_day': 0})
+    lease = JobLease(db, 0, 1, 7, lease_seconds=0.3)
+    lease.acquire()
+    try:
+        # 另一個執行在租期過期後接手，心跳發現自己已被移除
+        db.seed('job_leases', 'daily', {'holders': {'other': {'shard': 0, 'of': 1, 'hour': 7, 'expires_at': time.time() + 60}}})
+        deadline = time.time() + 2
+        while not lease.is_lost() and time.time() < deadline:
+            time.sleep(0.02)
+        assert lease.is_lost()
+        report = run_job(should_stop=lease.is_lost)
+    finally:
+        lease.release()
+    assert report['lease_lost'] and not report['completed']
+    assert line_api.sent_to() == []
+    assert list(db.data('job_leases', 'daily')['holders']) == ['other']
+
+def call_handler(path):
+    # 不經過 socket 直接呼叫 do_GET，回傳 (狀態碼, JSON 內容)
+    request = job.handler.__new__(job.handler)
+    request.path = path
+    request.headers = {}
+    request.wfile = io.BytesIO()
+    statuses = []
+    request.send_response = statuses.append
+    request.send_header = lambda *args: None
+    request.end_headers = lambda: None
+    request.do_GET()
+    return statuses[0], json.loads(request.wfile.getvalue())
@@ -0,0 +1,149 @@
+from api import send_daily_job as job
+from conftest import TODAY
+from core import ACTIVE_COUNTDOWNS
+
+def seed_active(db, chat_id, exam_day=TODAY.toordinal() + 10, send_hour=7, last_sent_day=0):
+    db.seed(ACTIVE_COUNTDOWNS, chat_id, {'exam_day': exam_day, 'send_hour': send_hour, 'last_sent_day': last_sent_day})
+
+def user_id(n):
+    return 'U' + format(n * 0x01000193 % 16 ** 32, '032x')
+
+def test_fetch_page_pages_through_id_range_with_cursor(db):
+    chat_ids = sorted(user_id(n) for n in range(1, 8))
+    for chat_id in chat_ids:
+        seed_active(db, chat_id)
+    seed_active(db, 'U' + 'f' * 32, send_hour=8)
+    seed_active(db, 'U' + 'e' * 32, last_sent_day=TODAY.toordinal())
+
+    pages = []
+    cursor = None
+    while True:
+        docs = job.fetch_page(db, TODAY, 7, cursor, 3)
+        pages.append([doc.id for doc in docs])
+        if len(docs) < 3:
+            break
+        cursor = job.page_cursor(docs[-1])
+    assert sum(pages, []) == chat_ids
+
+    start, end = chat_ids[2], chat_ids[5]
+    assert [doc.id for doc in job.fetch_page(db, TODAY, 7, None, 10, (start, end))] == chat_ids[2:5]
+
+def test_execute_job_sends_once_and_marks_sent(db, line_api, run_job):
+    chat_ids = [user_id(n) for n in range(1, 6)] + ['C' + '1' * 32]
+    for chat_id in chat_ids:
+        seed_active(db, chat_id)
+
+    report = run_job()
+    assert report["completed"]
+    assert line_api.sent_to() == sorted(chat_ids)
+    assert report["marked_sent"] == len(chat_ids)
+    assert all(db.data(ACTIVE_COUNTDOWNS, chat_id)['last_sent_day'] == TODAY.toordinal() for chat_id in chat_ids)
+
+    # 同一時段重跑不會再發送
+    line_api.multicasts.clear()
+    line_api.pushes.clear()
+    report = run_job()
+    assert report["completed"]
+    assert line_api.sent_to() == []
+
+def test_shards_split_chats_by_id_range(db, line_api, run_job):
+    chat_ids = [user_id(n) for n in range(1, 40)] + ['C' + '2' * 32]
+    for chat_id in chat_ids:
+        seed_active(db, chat_id)
+
+    sent = []
+    for shard in range(3):
+        for start_id, end_id in job.shard_ranges(shard, 3):
+            docs = job.fetch_page(db, TODAY, 7, None, 100, (start_id, end_id))
+            assert all((start_id is None or d.id >= start_id) and (end_id is None or d.id < end_id) for d in docs)
+        line_api.multicasts.clear()
+        line_api.pushes.clear()
+        assert run_job(shard=shard, of=3)["completed"]
+        sent.extend(line_api.sent_to())
+    assert sorted(sent) == sorted(chat_ids)
+
+def test_later_hour_catches_up_on_unsent_earlier_buckets(db, line_api, run_job, monkeypatch):
+    early, failed, current, later = (user_id(n) for n in range(1, 5))
+    seed_active(db, early, send_hour=6, exam_day=TODAY.toordinal() + 20)
+    seed_active(db, failed, send_hour=7)
+    seed_active(db, current, send_hour=8)
+    seed_active(db, later, send_hour=9)
+
+    # 06:00 的執行在時間預算內沒有完成
+    monkeypatch.setattr(job, 'JOB_TIME_BUDGET_SECONDS', 0)
+    assert not run_job(hour=6)["completed"]
+    monkeypatch.setattr(job, 'JOB_TIME_BUDGET_SECONDS', 50)
+
+    # 07:00 補發 06:00 的聊天室，自己時段的發送失敗
+    line_api.fail_for = {failed}
+    run_job(hour=7)
+    assert line_api.sent_to() == [early]
+
+    # 08:00 重試 07:00 失敗的聊天室，不會再發送已成功的聊天室
+    line_api.fail_for = set()
+    line_api.multicasts.clear()
+    assert run_job(hour=8)["completed"]
+    assert line_api.sent_to() == sorted([failed, current])
+
+def test_archive_counts_only_copied_chats(db):
+    expired = TODAY.toordinal() - 30
+    archived_id, orphan_id = user_id(1), user_id(2)
+    seed_active(db, archived_id, exam_day=expired, send_hour=9)
+    db.seed('chats', archived_id, {'type': 'user', 'exam_date': '2026-09-16', 'exam_day': expired, 'send_hour': 9})
+    seed_active(db, orphan_id, exam_day=expired)
+
+    assert job.archive_expired(db, TODAY, 9, 0, 1, 100) == 1
+    assert db.ids(ACTIVE_COUNTDOWNS) == []
+    assert db.ids('chats') == []
+    assert db.data('archived_chats', archived_id)['send_hour'] == 9
+
+def test_archive_skips_chat_updated_after_it_was_read(db, monkeypatch):
+    expired = TODAY.toordinal() - 30
+    raced_id, idle_id = user_id(1), user_id(2)
+    for chat_id in (raced_id, idle_id):
+        seed_active(db, chat_id, exam_day=expired)
+        db.seed('chats', chat_id, {'type': 'user', 'exam_date': '2026-09-16', 'exam_day': expired, 'send_hour': 7})
+
+    get_all = db.get_all
+    def get_all_then_set_new_date(references, field_paths=None):
+        snapshots = get_all(references, field_paths)
+        # 讀取之後、提交之前，使用者設定了新的考試日期
+        db.seed('chats', raced_id, {'type': 'user', 'exam_date': '2027-01-10', 'exam_day': TODAY.toordinal() + 86, 'send_hour': 7})
+        seed_active(db, raced_id, exam_day=TODAY.toordinal() + 86)
+        return snapshots
+    monkeypatch.setattr(db, 'get_all', get_all_then_set_new_date)
+
+    assert job.archive_expired(db, TODAY, 7, 0, 1, 100) == 1
+    assert db.data('chats', raced_id)['exam_date'] == '2027-01-10'
+    assert db.data(ACTIVE_COUNTDOWNS, raced_id)['exam_day'] == TODAY.toordinal() + 86
+    assert db.ids('archived_chats') == [idle_id]
+
+def test_failures_before_a_resume_keep_the_bucket_open(db, line_api, run_job, monkeypatch):
+    failed, other = user_id(1), user_id(2)
+    seed_active(db, failed, exam_day=TODAY.toordinal() + 10)
+    seed_active(db, other, exam_day=TODAY.toordinal() + 20)
+
+    # 第一次呼叫：一頁發送失敗後時間預算用完
+    monkeypatch.setattr(job, 'JOB_PAGE_SIZE', 1)
+    line_api.fail_for = {failed}
+    # 第一頁之後的等待視為逾時
+    timed_out = iter([False, True])
+    original_next_page = job.PageReader.next_page
+    def next_page_once(self, timeout):
+        if next(timed_out):
+            raise job.queue.Empty
+        return original_next_page(self, timeout)
+    monkeypatch.setattr(job.PageReader, 'next_page', next_page_once)
+    assert not run_job()["completed"]
+
+    # 第二次呼叫從游標之後接續，本身沒有失敗，但不能標記完成
+    monkeypatch.setattr(job.PageReader, 'next_page', original_next_page)
+    line_api.fail_for = set()
+    assert run_job()["completed"]
+    assert not db.data('job_runs', job.run_key(7, 0, 1))['done']
+
+    # 第三次呼叫重試先前失敗的聊天室
+    line_api.multicasts.clear()
+    assert run_job()["completed"]
+    assert line_api.sent_to() == [failed]
+    assert db.data('job_runs', job.run_key(7, 0, 1))['done']
@@ -0,0 +1,128 @@
+"""只有 webhook (app.py) 使用的執行個體內工具：計數器、TTL 快取與依 key 保序的執行器。
+
+與 core.py 分開，排程任務匯入 core 時不需要載入這些元件。
+"""
+import threading
+import time
+from collections import OrderedDict, deque
+from concurrent.futures import Future, ThreadPoolExecutor
+
+# --- 執行個體內的計數器 ---
+class Counters:
+    """執行緒安全的具名計數器，供 /metrics 使用。"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._values = {}
+
+    def incr(self, name, amount=1):
+        with self._lock:
+            self._values[name] = self._values.get(name, 0) + amount
+
+    def record_max(self, name, value):
+        # 只保留觀察到的最大值 (例如最長的處理延遲)
+        with self._lock:
+            if value > self._values.get(name, 0):
+                self._values[name] = value
+
+    def snapshot(self):
+        with self._lock:
+            return dict(self._values)
+
+metrics = Counters()
+
+# --- 執行個體內的快取 ---
+class TTLCache:
+    """有存活時間 (秒) 與容量上限的 LRU 快取 (執行緒安全)。
+
+    過期或不存在時 get() 回傳 default；命中與未命中的次數可由 stats() 取得。
+    """
+
+    def __init__(self, maxsize, ttl):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        now = time.monotonic()
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is not None:
+                expires_at, value = entry
+                if expires_at > now:
+                    self._data.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self._data[key]
+            self.misses += 1
+            return default
+
+    def set(self, key, value):
+        with self._lock:
+            self._data[key] = (time.monotonic() + self.ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def add(self, key, value=True):
+        # key 不存在或已過期時寫入並回傳 True；仍有效時不覆寫並回傳 False (原子操作)
+        now = time.monotonic()
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is not None and entry[0] > now:
+                return False
+            self._data[key] = (now + self.ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+            return True
+
+    def pop(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def stats(self):
+        with self._lock:
+            return {'hits': self.hits, 'misses': self.misses, 'size': len(self._data)}
+
+# --- 依 key 保序的執行器 ---
+class KeyedExecutor:
+    """不同 key 的工作並行執行，相同 key 的工作依提交順序逐一執行。
+
+    每個 key 有自己的待辦佇列，同一時間最多只有一個執行緒在處理某個 key。
+    """
+
+    def __init__(self, max_workers, thread_name_prefix='keyed'):
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix=thread_name_prefix)
+        self._lock = threading.Lock()
+        self._pending = {}
+
+    def submit(self, key, fn, *args):
+        future = Future()
+        with self._lock:
+            pending = self._pending.get(key)
+            if pending is not None:
+                # 這個 key 已經有執行緒在處理，排在它後面即可
+                pending.append((fn, args, future))
+                return future
+            self._pending[key] = deque([(fn, args, future)])
+        self._pool.submit(self._drain, key)
+        return future
+
+    def _drain(self, key):
+        while True:
+            with self._lock:
+                pending = self._pending[key]
+                if not pending:
+                    del self._pending[key]
+                    return
+                fn, args, future = pending.popleft()
+            if not future.set_running_or_notify_cancel():
+                continue
+            try:
+                future.set_result(fn(*args))
+            except BaseException as e:
+                future.set_exception(e)